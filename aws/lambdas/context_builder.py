@@ -0,0 +1,162 @@
+import os
+import re
+
+# Token-budgeted prompt assembly shared by the chat Lambdas.
+#
+# Prompt size drives both latency and cost, so every section of the prompt
+# (instructions, profile, recommendations, resume, history) is measured in
+# tokens and ranked; lower-priority sections are trimmed or dropped first.
+# Older conversation turns are folded into a rolling summary kept on the
+# chat history item instead of being resent verbatim on every request.
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', '1500'))
+SUMMARY_TOKEN_BUDGET = int(os.environ.get('SUMMARY_TOKEN_BUDGET', '250'))
+SUMMARY_TURN_TOKENS = 40
+SUMMARY_FIELDS = ('summary', 'lastTurnId', 'summarizedTurns')
+
+# Sections that would be left with fewer tokens than this are dropped
+# rather than included as a meaningless stub.
+MIN_SECTION_TOKENS = 24
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_RE = re.compile(r"(.+?[.!?])(\s|$)", re.S)
+
+
+def _token_spans(text):
+    # Approximates SentencePiece/BPE tokenizers without shipping one in the
+    # Lambda: punctuation is one token, words cost one token per ~4
+    # characters. This slightly over-counts, which keeps us under budget.
+    for match in _TOKEN_RE.finditer(text or ''):
+        word = match.group(0)
+        yield match.end(), max(1, (len(word) + 3) // 4)
+
+
+def count_tokens(text):
+    return sum(cost for _, cost in _token_spans(text))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text after the last whole token that fits in max_tokens."""
+    if max_tokens <= 0:
+        return ''
+    used = 0
+    end = 0
+    for span_end, cost in _token_spans(text):
+        if used + cost > max_tokens:
+            return text[:end].rstrip() + '...'
+        used += cost
+        end = span_end
+    return text
+
+
+def section(name, text, priority, required=False):
+    """A prompt section. Lower priority numbers are kept first."""
+    return {'name': name, 'text': text or '', 'priority': priority, 'required': required}
+
+
+def assemble(sections, budget=None):
+    """
+    Fit sections into the token budget and return (prompt, token_count).
+
+    Sections are admitted in priority order; a section that does not fit is
+    truncated to the remaining budget, or dropped if too little is left.
+    Admitted sections keep their original order in the output.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    remaining = budget
+    kept = {}
+
+    ranked = sorted(enumerate(sections), key=lambda pair: (not pair[1]['required'], pair[1]['priority'], pair[0]))
+    for index, sec in ranked:
+        if not sec['text'].strip():
+            continue
+        tokens = count_tokens(sec['text'])
+        if tokens <= remaining or sec['required']:
+            kept[index] = sec['text']
+            remaining -= tokens
+        elif remaining >= MIN_SECTION_TOKENS:
+            kept[index] = truncate_to_tokens(sec['text'], remaining)
+            remaining -= count_tokens(kept[index])
+
+    prompt = ''.join(kept[i] for i in sorted(kept))
+    return prompt, count_tokens(prompt)
+
+
+def fit_recent_turns(turns, budget, render):
+    """
+    Return the longest suffix of turns whose rendered text fits the budget.
+
+    render(turn) -> str is used for measuring, so callers can format turns
+    however their prompt needs them.
+    """
+    selected = []
+    used = 0
+    for turn in reversed(turns):
+        cost = count_tokens(render(turn))
+        if used + cost > budget:
+            break
+        selected.append(turn)
+        used += cost
+    selected.reverse()
+    return selected, used
+
+
+# ------------------------------
+# Rolling conversation summary
+# ------------------------------
+
+def _first_sentence(text):
+    text = ' '.join((text or '').split())
+    match = _SENTENCE_RE.match(text)
+    return match.group(1) if match else text
+
+
+def summarize_turn(role, content):
+    speaker = 'User' if role == 'user' else 'Advisor'
+    return f"- {speaker}: {truncate_to_tokens(_first_sentence(content), SUMMARY_TURN_TOKENS)}"
+
+
+def fold_into_summary(summary_item, turns):
+    """
+    Incrementally extend a summary with turns that left the history window.
+
+    turns is a list of (role, content, turn_id). When turn ids are available
+    (gemini-chat) anything at or below the stored watermark has already been
+    summarized and is skipped, so clients resending old history are harmless.
+    The oldest summary lines are dropped once SUMMARY_TOKEN_BUDGET is reached.
+    Returns the updated item, or None if nothing changed.
+    """
+    summary_item = dict(summary_item or {})
+    watermark = summary_item.get('lastTurnId')
+    lines = [line for line in summary_item.get('summary', '').split('\n') if line]
+
+    folded = 0
+    for role, content, turn_id in turns:
+        if turn_id is not None and watermark is not None and int(turn_id) <= int(watermark):
+            continue
+        lines.append(summarize_turn(role, content))
+        if turn_id is not None:
+            watermark = turn_id
+        folded += 1
+
+    if not folded:
+        return None
+
+    while len(lines) > 1 and count_tokens('\n'.join(lines)) > SUMMARY_TOKEN_BUDGET:
+        lines.pop(0)
+
+    summary_item['summary'] = '\n'.join(lines)
+    if watermark is not None:
+        summary_item['lastTurnId'] = watermark
+    summary_item['summarizedTurns'] = int(summary_item.get('summarizedTurns', 0)) + folded
+    return summary_item
+
+
+def summary_fields(item):
+    """
+    The rolling-summary attributes of a chat history item.
+
+    The summary is stored on the history item each handler already reads
+    and writes, so keeping it costs no extra DynamoDB calls.
+    """
+    return {key: item[key] for key in SUMMARY_FIELDS if key in (item or {})}
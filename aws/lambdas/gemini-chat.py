@@ -1,25 +1,38 @@
 import json
 import os
-import boto3
+import time
 from datetime import datetime
 import urllib3
+import context_builder
+import lambda_runtime
+import resilience
+import semantic_cache
+import tracing
 
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table('ResuMAXUsers')
-
-# HTTP client
-http = urllib3.PoolManager()
+# Clients are created once per container and reused by warm invocations
+table = lambda_runtime.get_table()
+http = lambda_runtime.http
 
 # Environment variable for your Gemini API key
 API_KEY = os.environ.get('GEMINI_API_KEY')
 MODEL = "gemini-2.5-flash"
+GEMINI_API_BASE = os.environ.get('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com')
+HISTORY_TOKEN_BUDGET = int(os.environ.get('HISTORY_TOKEN_BUDGET', '600'))
+# Most recent turns considered for the prompt; older ones live in the summary
+PROMPT_TURNS = 5
+# Returned in place of an answer; never cached
+NO_OUTPUT_REPLY = "No output received."
+DECODE_ERROR_REPLY = "Error decoding Gemini response."
+PLACEHOLDER_REPLIES = (NO_OUTPUT_REPLY, DECODE_ERROR_REPLY)
 
+@tracing.traced_handler('gemini-chat')
 def lambda_handler(event, context):
     # CORS headers
     cors_headers = {
         'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-        'Access-Control-Allow-Methods': 'GET,POST,PUT,OPTIONS'
+        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,traceparent',
+        'Access-Control-Allow-Methods': 'GET,POST,PUT,OPTIONS',
+        'Access-Control-Expose-Headers': 'traceparent'
     }
     
     # Handle OPTIONS preflight
@@ -39,51 +52,92 @@ def lambda_handler(event, context):
         recommendations = body.get('recommendations', {})
         previous_chats = body.get('previousChats', [])
 
-        # Build context prompt
-        context_prompt = build_context_prompt(user_profile, recommendations, previous_chats)
-        full_prompt = f"{context_prompt}\n\nUser message: {message}\n\nRespond helpfully and conversationally."
-
-        # Call Gemini API
-        payload = {
-            "model": MODEL,
-            "input": full_prompt
-        }
+        summary_item = load_summary(user_id)
 
-        response = http.request(
-            "POST",
-            f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL}:generateContent?key={API_KEY}",
-            body=json.dumps(payload),
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {API_KEY}"
-            }
+        # Turns resent verbatim; everything older is folded into the summary so
+        # each turn is always in one or the other. It is saved with the chats
+        recent_chats, _ = context_builder.fit_recent_turns(
+            previous_chats[-PROMPT_TURNS:], HISTORY_TOKEN_BUDGET, render_chat
         )
+        older_chats = previous_chats[:len(previous_chats) - len(recent_chats)]
+        summary_item = context_builder.fold_into_summary(
+            summary_item, [(c.get('type'), c.get('content', ''), c.get('id')) for c in older_chats]
+        ) or summary_item
 
-        # Debug logs
-        raw_response = response.data.decode("utf-8")
-        print("HTTP status:", response.status)
-        print("Raw Gemini response:", raw_response)
+        # Near-duplicate general questions from similar profiles reuse an answer.
+        # Only turns without conversation context are shared: a follow-up like
+        # "can you give examples?" means something different in every chat
+        summary = summary_item.get('summary', '')
+        signature = semantic_cache.profile_signature(user_profile)
+        if recent_chats or summary:
+            cache_status, ai_response = 'bypass', None
+        else:
+            with tracing.span('cache.lookup') as span:
+                cache_status, ai_response = semantic_cache.answers.lookup(message, signature)
+                span.set(result=cache_status)
+        prompt_tokens = 0
+        backend = 'cache'
 
-        # Try parsing JSON safely
-        try:
-            resp_data = json.loads(raw_response)
-            ai_response = resp_data.get("outputText", "No output received.")
-        except json.JSONDecodeError:
-            ai_response = f"Error decoding Gemini response: {raw_response}"
+        if cache_status != 'hit':
+            # Build context prompt within the token budget. A 'miss' answer is
+            # shared with everyone in the same cache partition, so it is built from
+            # the signature fields alone; personal questions and turns with
+            # conversation context ('bypass') get the full profile, history and
+            # recommendations but are never cached.
+            with tracing.span('prompt.build') as span:
+                if cache_status == 'miss':
+                    shared_profile = {k: user_profile.get(k, '') for k in ('major', 'desiredOccupation')}
+                    context_prompt, prompt_tokens = build_context_prompt(shared_profile, {}, [])
+                else:
+                    context_prompt, prompt_tokens = build_context_prompt(
+                        user_profile, recommendations, recent_chats, summary
+                    )
+                full_prompt = f"{context_prompt}\n\nUser message: {message}\n\nRespond helpfully and conversationally."
+                prompt_tokens += context_builder.count_tokens(message)
+                span.set(promptTokens=prompt_tokens)
+
+            # Call Gemini API, falling back to the Llama server if configured
+            started = time.monotonic()
+            ai_response, backend = resilience.call_with_fallback(
+                lambda timeout: call_gemini(full_prompt, timeout),
+                resilience.deadline_from_context(context),
+                fallback_payload=build_llama_payload(message, user_profile) if resilience.LLAMA_FALLBACK_URL else None
+            )
+            if backend == 'gemini' and cache_status == 'miss' and ai_response not in PLACEHOLDER_REPLIES:
+                semantic_cache.answers.store(
+                    message, signature, ai_response,
+                    latency_ms=(time.monotonic() - started) * 1000,
+                    private_terms=(user_profile.get('firstName'), user_profile.get('lastName'))
+                )
+        print(json.dumps({'semanticCache': cache_status, **semantic_cache.answers.stats()}))
 
         # Update chat history in DynamoDB
-        updated_chats = update_chat_history(user_id, message, ai_response, previous_chats)
+        updated_chats = update_chat_history(user_id, message, ai_response, previous_chats, summary_item)
 
-        return {
-            'statusCode': 200,
-            'headers': cors_headers,
-            'body': json.dumps({
+        with tracing.span('serialize') as span:
+            response_body = json.dumps({
                 'reply': ai_response,
                 'chatHistory': updated_chats,
+                'promptTokens': prompt_tokens,
+                'backend': backend,
+                'cache': cache_status,
                 'timestamp': datetime.now().isoformat()
             })
+            span.set(bytes=len(response_body))
+
+        return {
+            'statusCode': 200,
+            'headers': cors_headers,
+            'body': response_body
         }
 
+    except (resilience.CircuitOpenError, resilience.DeadlineExceeded) as e:
+        print(f"Gemini unavailable: {str(e)}")
+        return {
+            'statusCode': 503,
+            'headers': cors_headers,
+            'body': json.dumps({'error': str(e)})
+        }
     except Exception as e:
         print(f"Error in Lambda: {str(e)}")
         return {
@@ -93,11 +147,72 @@ def lambda_handler(event, context):
         }
 
 
-def build_context_prompt(user_profile, recommendations, previous_chats):
+def call_gemini(full_prompt, timeout):
+    payload = {
+        "model": MODEL,
+        "input": full_prompt
+    }
+
+    with tracing.span('gemini.generate', model=MODEL) as span:
+        response = http.request(
+            "POST",
+            f"{GEMINI_API_BASE}/v1beta/models/{MODEL}:generateContent?key={API_KEY}",
+            body=json.dumps(payload),
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {API_KEY}"
+            },
+            timeout=urllib3.Timeout(connect=min(2.0, timeout), read=timeout),
+            retries=False
+        )
+        # Sizes only; the response body is never logged
+        raw_response = response.data.decode("utf-8")
+        span.set(httpStatus=response.status, responseBytes=len(raw_response))
+
+        # Non-200s are classified so only transient failures are retried
+        resilience.check_response(response, "Gemini")
+
+    # Try parsing JSON safely
+    try:
+        resp_data = json.loads(raw_response)
+        return resp_data.get("outputText", NO_OUTPUT_REPLY)
+    except json.JSONDecodeError:
+        return DECODE_ERROR_REPLY
+
+
+def join_list(values, render=str):
+    if isinstance(values, list):
+        return ', '.join(render(value) for value in values if value)
+    return values or ''
+
+
+def build_llama_payload(message, user_profile):
+    # Maps the chat request onto llama_server.py's /generate input schema; the
+    # frontend stores experiences and projects as lists of objects
+    return {
+        'desired_job': user_profile.get('desiredOccupation', ''),
+        'skills': join_list(user_profile.get('skills')),
+        'job_experience': join_list(user_profile.get('experiences'), lambda exp: f"{exp.get('position', '')} at {exp.get('company', '')}" if isinstance(exp, dict) else str(exp)),
+        'clubs': join_list(user_profile.get('clubs')),
+        'projects': join_list(user_profile.get('projects'), lambda proj: proj.get('name', '') if isinstance(proj, dict) else str(proj)),
+        'question': message
+    }
+
+
+def render_chat(chat):
+    return f"{(chat.get('type') or '').capitalize()}: {chat.get('content', '')}\n"
+
+
+def build_context_prompt(user_profile, recommendations, recent_chats, summary=''):
+    """
+    Return (prompt, token_count) with sections ranked to fit the token budget.
+
+    recent_chats are the turns to resend verbatim (already fitted to
+    HISTORY_TOKEN_BUDGET); older turns are expected to be in summary.
+    """
     profile_context = f"""
 USER PROFILE:
 - Name: {user_profile.get('firstName', '')} {user_profile.get('lastName', '')}
-- Email: {user_profile.get('email', '')}
 - School: {user_profile.get('school', '')}
 - Major: {user_profile.get('major', '')}
 - GPA: {user_profile.get('gpa', '')}
@@ -111,34 +226,53 @@ USER PROFILE:
     rec_context = ""
     if recommendations:
         rec_context = "\nCURRENT RECOMMENDATIONS:\n"
+        if recommendations.get('skills'):
+            rec_context += f"Skills to Develop: {', '.join(recommendations['skills'])}\n"
+        if recommendations.get('classes'):
+            rec_context += f"Recommended Classes: {', '.join(recommendations['classes'])}\n"
+        if recommendations.get('companies'):
+            rec_context += f"Target Companies: {', '.join(recommendations['companies'])}\n"
         if recommendations.get('actionPlan'):
             rec_context += "Action Plan:\n"
             for phase in recommendations['actionPlan']:
                 rec_context += f"- {phase.get('priority', '')}: {phase.get('duration', '')}\n"
                 for task in phase.get('tasks', []):
                     rec_context += f"  * {task.get('title', '')}: {task.get('description', '')[:100]}...\n"
-        if recommendations.get('classes'):
-            rec_context += f"Recommended Classes: {', '.join(recommendations['classes'])}\n"
-        if recommendations.get('companies'):
-            rec_context += f"Target Companies: {', '.join(recommendations['companies'])}\n"
-        if recommendations.get('skills'):
-            rec_context += f"Skills to Develop: {', '.join(recommendations['skills'])}\n"
+
+    summary_context = f"\nEARLIER CONVERSATION (summary):\n{summary}\n" if summary else ""
 
     chat_context = ""
-    if previous_chats:
-        chat_context = "\nRECENT CONVERSATION HISTORY:\n"
-        for chat in previous_chats[-5:]:
-            chat_context += f"{chat.get('type').capitalize()}: {chat.get('content', '')}\n"
+    if recent_chats:
+        chat_context = "\nRECENT CONVERSATION HISTORY:\n" + ''.join(render_chat(c) for c in recent_chats)
 
     instructions = """
 INSTRUCTIONS:
 You are a helpful AI Career Advisor. Use the user's profile, recommendations, and chat history to provide personalized, actionable advice. Be encouraging and conversational.
 """
 
-    return f"{instructions}{profile_context}{rec_context}{chat_context}"
+    return context_builder.assemble([
+        context_builder.section('instructions', instructions, 0, required=True),
+        context_builder.section('profile', profile_context, 1),
+        context_builder.section('recommendations', rec_context, 3),
+        context_builder.section('summary', summary_context, 4),
+        context_builder.section('history', chat_context, 2),
+    ])
+
+
+def load_summary(user_id):
+    # The rolling summary is kept on the item update_chat_history writes
+    try:
+        response = table.get_item(
+            Key={'userID': user_id, 'dataType': 'user-data'},
+            ProjectionExpression=', '.join(context_builder.SUMMARY_FIELDS)
+        )
+        return context_builder.summary_fields(response.get('Item'))
+    except Exception as e:
+        print(f"DynamoDB Summary Read Error: {e}")
+        return {}
 
 
-def update_chat_history(user_id, user_message, ai_response, previous_chats):
+def update_chat_history(user_id, user_message, ai_response, previous_chats, summary_item=None):
     user_chat = {
         'id': int(datetime.now().timestamp() * 1000) - 1,
         'type': 'user',
@@ -156,12 +290,17 @@ def update_chat_history(user_id, user_message, ai_response, previous_chats):
     all_chats = previous_chats + [user_chat, ai_chat]
     recent_chats = all_chats[-10:]
 
+    # Turns falling out of the stored window are folded into the rolling summary
+    evicted = [(c.get('type'), c.get('content', ''), c.get('id')) for c in all_chats[:-10]]
+    summary_item = context_builder.fold_into_summary(summary_item, evicted) or summary_item or {}
+
     try:
         table.put_item(
             Item={
                 'userID': user_id,
                 'dataType': 'user-data',
                 'previousChats': recent_chats,
+                **context_builder.summary_fields(summary_item),
                 'lastUpdated': datetime.now().isoformat()
             }
         )
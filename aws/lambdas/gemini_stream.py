@@ -0,0 +1,86 @@
+import json
+
+import urllib3
+
+import resilience
+import tracing
+
+# Incremental parsing of Gemini's :streamGenerateContent?alt=sse responses.
+# Text is yielded as soon as each server-sent event arrives instead of after
+# the whole reply has been generated.
+
+SAFETY_BLOCKED_PROMPT = "I'm sorry, I cannot process that request due to safety policies."
+SAFETY_BLOCKED_RESPONSE = "The response was blocked by safety filters."
+# Shown to the user but not real answers, so they are never cached
+PLACEHOLDER_REPLIES = (SAFETY_BLOCKED_PROMPT, SAFETY_BLOCKED_RESPONSE)
+
+
+def open_stream(http, url, payload, timeout=None):
+    """
+    POST the request and return the unread response once headers arrive.
+
+    Non-200 responses are read, released and raised as a classified
+    resilience.UpstreamError, so opening the stream can be retried like any
+    other call. Nothing is retried after the body has started.
+    """
+    # Measures time to response headers; the body is read by iter_text
+    with tracing.span('gemini.stream_open') as span:
+        response = http.request(
+            'POST',
+            url,
+            body=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            timeout=urllib3.Timeout(connect=min(2.0, timeout), read=timeout) if timeout else None,
+            retries=False,
+            preload_content=False
+        )
+        span.set(httpStatus=response.status)
+        if response.status != 200:
+            response.read()
+            response.release_conn()
+            resilience.check_response(response, 'Gemini API')
+    return response
+
+
+def discard(response):
+    """Close a stream that will not be read and return its pool slot."""
+    response.close()
+    response.release_conn()
+
+
+def iter_events(lines):
+    """Yield decoded JSON payloads from an iterable of SSE byte lines."""
+    data = []
+    for raw in lines:
+        line = raw.decode('utf-8').rstrip('\r\n')
+        if not line:
+            if data:
+                yield json.loads('\n'.join(data))
+                data = []
+        elif line.startswith('data:'):
+            data.append(line[5:].lstrip())
+    if data:
+        yield json.loads('\n'.join(data))
+
+
+def iter_text(response):
+    """Yield text chunks from a streaming response, then release it."""
+    try:
+        for event in iter_events(response):
+            if event.get('promptFeedback', {}).get('blockReason'):
+                yield SAFETY_BLOCKED_PROMPT
+                return
+            for candidate in event.get('candidates', [])[:1]:
+                if candidate.get('finishReason') == 'SAFETY':
+                    yield SAFETY_BLOCKED_RESPONSE
+                    return
+                for part in candidate.get('content', {}).get('parts', []):
+                    if part.get('text'):
+                        yield part['text']
+    finally:
+        response.release_conn()
+
+
+def sse(payload):
+    """Encode one server-sent event for the client."""
+    return f"data: {json.dumps(payload)}\n\n".encode('utf-8')
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import urllib3
+
+import tracing
+
+# Per-container clients shared by the Lambdas.
+#
+# Everything here is created once per container and reused by every warm
+# invocation. boto3 is imported on first use so modules that never touch
+# DynamoDB (and the local harnesses) do not pay for it.
+
+TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME', 'ResuMAXUsers')
+
+DDB_CONNECT_TIMEOUT = float(os.environ.get('DDB_CONNECT_TIMEOUT', '1'))
+DDB_READ_TIMEOUT = float(os.environ.get('DDB_READ_TIMEOUT', '3'))
+DDB_MAX_POOL_CONNECTIONS = int(os.environ.get('DDB_MAX_POOL_CONNECTIONS', '10'))
+HTTP_MAX_POOL_SIZE = int(os.environ.get('HTTP_MAX_POOL_SIZE', '4'))
+
+# Pooled HTTP client for Gemini and the Llama server; connections are kept
+# alive between warm invocations
+http = urllib3.PoolManager(num_pools=4, maxsize=HTTP_MAX_POOL_SIZE)
+
+_resource = None
+_tables = {}
+
+
+def boto_config():
+    from botocore.config import Config
+
+    return Config(
+        connect_timeout=DDB_CONNECT_TIMEOUT,
+        read_timeout=DDB_READ_TIMEOUT,
+        max_pool_connections=DDB_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        retries={'max_attempts': 3, 'mode': 'standard'}
+    )
+
+
+def dynamodb_resource():
+    global _resource
+    if _resource is None:
+        import boto3
+
+        _resource = boto3.resource('dynamodb', config=boto_config())
+    return _resource
+
+
+def get_table(name=None):
+    """Return the container-wide Table object (traced), creating it on first use."""
+    name = name or TABLE_NAME
+    if name not in _tables:
+        _tables[name] = dynamodb_resource().Table(name)
+    return tracing.TracedTable(_tables[name])
+
+
+class TTLCache:
+    """
+    Small per-container LRU cache whose entries expire after ttl seconds.
+
+    Warm invocations of the same container share it; other containers keep
+    their own copy, so ttl bounds how stale a read can be.
+    """
+
+    def __init__(self, ttl, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if time.monotonic() >= expires_at:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+def log_exception():
+    # traceback is only needed on the error path
+    import traceback
+
+    traceback.print_exc()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Report import and cold-start time for each Lambda.
+
+Every Lambda is loaded in a fresh interpreter, the way a new container
+would, and timed in three steps: imports + module-level init, the first
+(cold) invocation and a second (warm) invocation. The invocations use an
+OPTIONS preflight, so no network calls are made. `-X importtime` output is
+used to list the slowest imports.
+
+    python measure_init.py                  # table for all Lambdas
+    python measure_init.py --max-init-ms 400  # exit 1 if any Lambda is slower
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(os.path.dirname(HERE))
+
+LAMBDAS = {
+    'gemini-chat': os.path.join(HERE, 'gemini-chat.py'),
+    'resumax-user': os.path.join(HERE, 'resumax-user.py'),
+    'chat-fallback': os.path.join(REPO, 'frontend', 'UPDATED_LAMBDA_WITH_FALLBACK.py'),
+}
+
+# Runs inside the child interpreter
+PROBE = r"""
+import importlib.util, json, sys, time
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location('lambda_module', sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+init_ms = (time.perf_counter() - start) * 1000
+
+class Context:
+    aws_request_id = 'measure-init'
+    def get_remaining_time_in_millis(self):
+        return 30000
+
+event = {'httpMethod': 'OPTIONS', 'requestContext': {'http': {'method': 'OPTIONS'}}}
+start = time.perf_counter()
+module.lambda_handler(event, Context())
+first_ms = (time.perf_counter() - start) * 1000
+start = time.perf_counter()
+module.lambda_handler(event, Context())
+warm_ms = (time.perf_counter() - start) * 1000
+print('MEASURE_INIT ' + json.dumps({'init_ms': init_ms, 'first_ms': first_ms, 'warm_ms': warm_ms}))
+"""
+
+
+def slowest_imports(stderr, limit):
+    # importtime lines: "import time: self [us] | cumulative | imported package"
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):
+            rows.append((int(cumulative), name.strip()))
+    rows.sort(reverse=True)
+    return [(name, us / 1000.0) for us, name in rows[:limit]]
+
+
+def measure(path, top):
+    env = dict(os.environ)
+    env.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [HERE, os.path.dirname(path), env.get('PYTHONPATH')]))
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE, path],
+        capture_output=True, text=True, env=env
+    )
+    result = None
+    for line in proc.stdout.splitlines():
+        if line.startswith('MEASURE_INIT '):
+            result = json.loads(line[len('MEASURE_INIT '):])
+    if result is None:
+        return {'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'no output'}
+    result['imports'] = slowest_imports(proc.stderr, top)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-init-ms', type=float, help='fail if init + first invocation exceeds this')
+    parser.add_argument('--top', type=int, default=5, help='slowest top-level imports to list')
+    parser.add_argument('--json', action='store_true', help='print raw results as JSON')
+    parser.add_argument('names', nargs='*', help=f"subset of: {', '.join(LAMBDAS)}")
+    args = parser.parse_args()
+
+    results = {name: measure(LAMBDAS[name], args.top) for name in (args.names or LAMBDAS)}
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, result in results.items():
+            if 'error' in result:
+                print(f"{name:<14} ERROR {result['error']}")
+                continue
+            print(f"{name:<14} init {result['init_ms']:8.1f} ms   first call {result['first_ms']:6.1f} ms   warm call {result['warm_ms']:6.2f} ms")
+            for module, ms in result['imports']:
+                print(f"{'':<16}{module:<32} {ms:8.1f} ms")
+
+    failed = [
+        name for name, result in results.items()
+        if 'error' in result
+        or (args.max_init_ms is not None and result['init_ms'] + result['first_ms'] > args.max_init_ms)
+    ]
+    if failed:
+        print(f"Cold start check failed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+#!/bin/bash
+
+# Build a deployment zip for one Lambda handler.
+#
+# The handlers import the shared modules in this directory (context_builder,
+# gemini_stream, lambda_runtime, resilience, semantic_cache, tracing), so a
+# handler deployed as a single file fails at import. This copies the handler
+# in as lambda_function.py (handler: lambda_function.lambda_handler) next to
+# the shared modules and zips them.
+#
+#   ./package_lambda.sh gemini-chat.py
+#   ./package_lambda.sh ../../frontend/UPDATED_LAMBDA_WITH_FALLBACK.py gemc.zip
+#   aws lambda update-function-code --function-name <name> --zip-file fileb://gemc.zip
+
+set -e
+
+HANDLER="$1"
+OUTPUT="${2:-$(basename "${HANDLER%.py}").zip}"
+LAMBDAS_DIR="$(cd "$(dirname "$0")" && pwd)"
+SHARED_MODULES="context_builder.py gemini_stream.py lambda_runtime.py resilience.py semantic_cache.py tracing.py"
+
+if [ -z "$HANDLER" ] || [ ! -f "$HANDLER" ]; then
+    echo "Usage: $0 <handler.py> [output.zip]"
+    exit 1
+fi
+
+BUILD_DIR="$(mktemp -d)"
+trap 'rm -rf "$BUILD_DIR"' EXIT
+
+cp "$HANDLER" "$BUILD_DIR/lambda_function.py"
+for module in $SHARED_MODULES; do
+    cp "$LAMBDAS_DIR/$module" "$BUILD_DIR/"
+done
+
+OUTPUT_PATH="$(cd "$(dirname "$OUTPUT")" && pwd)/$(basename "$OUTPUT")"
+rm -f "$OUTPUT_PATH"
+(cd "$BUILD_DIR" && zip -q "$OUTPUT_PATH" *.py)
+
+echo "✅ Packaged $HANDLER -> $OUTPUT_PATH"
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+Local performance harness for the Lambda handlers.
+
+Runs each lambda_handler in-process against an in-memory DynamoDB stand-in
+and a fake Gemini HTTP server with configurable latency, so handler changes
+can be measured without deploying. API Gateway v1 (REST) and v2 (HTTP API)
+events are generated and invoked at the requested concurrency. Reported per
+handler: p50/p99 handler latency, DynamoDB calls by operation and
+request/response body sizes, plus the semantic cache hit rate for the chat
+handlers (repeated questions are mostly cache hits unless the cache is off).
+
+    python perf_harness.py                            # all handlers, defaults
+    python perf_harness.py --requests 500 --concurrency 16 --gemini-latency-ms 300
+    python perf_harness.py --handlers resumax-user --json > baseline.json
+    python perf_harness.py --handlers gemini-chat --no-semantic-cache   # uncached chat path
+
+boto3/botocore must be importable (they are Lambda runtime dependencies),
+but no AWS credentials or network access are needed.
+"""
+
+import argparse
+import contextlib
+import copy
+import importlib.util
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(os.path.dirname(HERE))
+
+HANDLERS = {
+    'gemini-chat': os.path.join(HERE, 'gemini-chat.py'),
+    'resumax-user': os.path.join(HERE, 'resumax-user.py'),
+    'chat-fallback': os.path.join(REPO, 'frontend', 'UPDATED_LAMBDA_WITH_FALLBACK.py'),
+}
+
+QUESTIONS = [
+    'How do I get an internship at Google?',
+    'What should I learn for SWE?',
+    'How can I improve my resume for data science roles?',
+    'Which clubs should I join as a sophomore?',
+    'What projects look good for ML engineering?',
+    'How do I prepare for behavioral interviews?',
+]
+
+
+# ------------------------------
+# In-memory DynamoDB stand-in
+# ------------------------------
+
+class FakeTable:
+    """
+    Enough of boto3's Table for the Lambdas: get/put/update/delete_item and
+    batch_writer, including SET/REMOVE update expressions with attribute
+    names, nested paths, list indexes and if_not_exists(). Calls are counted
+    per operation.
+    """
+
+    def __init__(self, name='ResuMAXUsers'):
+        self.name = name
+        self.items = {}
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(key):
+        return (key['userID'], key['dataType'])
+
+    def get_item(self, Key, **kwargs):
+        with self.lock:
+            self.calls['GetItem'] += 1
+            item = self.items.get(self._key(Key))
+            return {'Item': copy.deepcopy(item)} if item is not None else {}
+
+    def put_item(self, Item, **kwargs):
+        with self.lock:
+            self.calls['PutItem'] += 1
+            self.items[self._key(Item)] = copy.deepcopy(Item)
+        return {}
+
+    def delete_item(self, Key, **kwargs):
+        with self.lock:
+            self.calls['DeleteItem'] += 1
+            self.items.pop(self._key(Key), None)
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None, ExpressionAttributeNames=None, **kwargs):
+        with self.lock:
+            self.calls['UpdateItem'] += 1
+            item = copy.deepcopy(self.items.get(self._key(Key), dict(Key)))
+            names = ExpressionAttributeNames or {}
+            values = ExpressionAttributeValues or {}
+            for action, clauses in _parse_update(UpdateExpression):
+                for clause in clauses:
+                    if action == 'SET':
+                        path, expression = [part.strip() for part in clause.split('=', 1)]
+                        _set_path(item, _parse_path(path, names), _evaluate(item, expression, names, values))
+                    elif action == 'REMOVE':
+                        _remove_path(item, _parse_path(clause.strip(), names))
+            self.items[self._key(Key)] = item
+        return {}
+
+    def batch_writer(self, **kwargs):
+        return _BatchWriter(self)
+
+
+class _BatchWriter:
+    def __init__(self, table):
+        self.table = table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def put_item(self, Item):
+        self.table.put_item(Item=Item)
+
+    def delete_item(self, Key):
+        self.table.delete_item(Key=Key)
+
+
+def _split_top_level(text):
+    parts, depth, current = [], 0, ''
+    for char in text:
+        if char == ',' and depth == 0:
+            parts.append(current)
+            current = ''
+            continue
+        depth += char == '('
+        depth -= char == ')'
+        current += char
+    if current.strip():
+        parts.append(current)
+    return parts
+
+
+def _parse_update(expression):
+    sections = re.split(r'\b(SET|REMOVE)\b', expression)
+    return [(sections[i], _split_top_level(sections[i + 1])) for i in range(1, len(sections), 2)]
+
+
+def _parse_path(path, names):
+    segments = []
+    for part in path.split('.'):
+        match = re.match(r'^([^\[]+)((?:\[\d+\])*)$', part.strip())
+        segments.append(names.get(match.group(1), match.group(1)))
+        segments += [int(index) for index in re.findall(r'\[(\d+)\]', match.group(2))]
+    return segments
+
+
+def _validation_error(message):
+    from botocore.exceptions import ClientError
+    return ClientError({'Error': {'Code': 'ValidationException', 'Message': message}}, 'UpdateItem')
+
+
+def _parent(item, segments):
+    node = item
+    for segment in segments[:-1]:
+        try:
+            node = node[segment]
+        except (KeyError, IndexError, TypeError):
+            raise _validation_error('The document path provided in the update expression is invalid for update')
+    return node
+
+
+def _set_path(item, segments, value):
+    parent = _parent(item, segments)
+    if isinstance(parent, list) and segments[-1] >= len(parent):
+        parent.append(value)
+    else:
+        parent[segments[-1]] = value
+
+
+def _remove_path(item, segments):
+    try:
+        parent = _parent(item, segments)
+        del parent[segments[-1]]
+    except (KeyError, IndexError):
+        pass
+    except Exception as e:
+        if 'ValidationException' not in str(e):
+            raise
+
+
+def _evaluate(item, expression, names, values):
+    match = re.match(r'^if_not_exists\((.+),\s*(:\w+)\)$', expression)
+    if match:
+        try:
+            node = item
+            for segment in _parse_path(match.group(1), names):
+                node = node[segment]
+            return node
+        except (KeyError, IndexError, TypeError):
+            return copy.deepcopy(values[match.group(2)])
+    return copy.deepcopy(values[expression])
+
+
+# ------------------------------
+# Fake Gemini server
+# ------------------------------
+
+def start_fake_gemini(latency_ms, reply_words):
+    reply = ' '.join(['advice'] * reply_words)
+
+    class FakeGemini(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True  # otherwise delayed ACKs add ~40ms per call
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(latency_ms / 1000.0)
+            if ':streamGenerateContent' in self.path:
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for word in reply.split():
+                    event = f"data: {json.dumps({'candidates': [{'content': {'parts': [{'text': word + ' '}]}}]})}\r\n\r\n".encode()
+                    self.wfile.write(f"{len(event):X}\r\n".encode() + event + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+                return
+            # Both response shapes: generateContent candidates and gemini-chat's outputText
+            body = json.dumps({
+                'candidates': [{'content': {'parts': [{'text': reply}]}}],
+                'outputText': reply
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGemini)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+# ------------------------------
+# Events
+# ------------------------------
+
+def api_event(version, method, body=None, query=None, headers=None):
+    body_text = json.dumps(body) if body is not None else None
+    if version == 1:
+        return {
+            'httpMethod': method,
+            'path': '/',
+            'headers': headers or {'Content-Type': 'application/json'},
+            'queryStringParameters': query,
+            'body': body_text
+        }
+    return {
+        'version': '2.0',
+        'rawPath': '/',
+        'headers': {k.lower(): v for k, v in (headers or {'Content-Type': 'application/json'}).items()},
+        'queryStringParameters': query,
+        'requestContext': {'http': {'method': method}, 'requestId': str(uuid.uuid4())},
+        'body': body_text
+    }
+
+
+OCCUPATIONS = ['Software Engineer', 'Data Scientist', 'Product Manager', 'ML Engineer']
+
+
+def form_data(i):
+    # Same shape the frontend saves: experiences and projects are objects
+    return {
+        'firstName': f'Student{i}',
+        'school': 'University of Washington',
+        'major': 'Computer Science',
+        'desiredOccupation': OCCUPATIONS[i % len(OCCUPATIONS)],
+        'skills': ['Python', 'SQL', 'React'],
+        'experiences': [{'position': 'Software Engineering Intern', 'company': f'Company {i % 7}'}],
+        'clubs': ['ACM'],
+        'projects': [{'name': f'Project {i}'}],
+    }
+
+
+def make_event(name, i, users, version, rng):
+    user_id = f'user-{i % users}'
+    if name == 'resumax-user':
+        roll = rng.random()
+        if roll < 0.7:
+            return api_event(version, 'GET', query={'userId': user_id})
+        if roll < 0.9:
+            return api_event(version, 'PATCH', body={'userId': user_id, 'patch': [
+                {'op': 'replace', 'path': f'/completedActivities/0-{i % 4}', 'value': {'completed': True}}
+            ]})
+        return api_event(version, 'POST', body={
+            'userId': user_id,
+            'formData': form_data(i),
+            'recommendations': {'skills': ['Python'] * 50, 'classes': ['CSE 373'] * 20},
+            'completedActivities': {}
+        })
+    message = rng.choice(QUESTIONS)
+    if name == 'gemini-chat':
+        return api_event(version, 'POST', body={
+            'userID': user_id,
+            'message': message,
+            'userProfile': form_data(i),
+            'recommendations': {'skills': ['Python', 'SQL'], 'classes': ['CSE 373']},
+            'previousChats': []
+        })
+    return api_event(version, 'POST', body={'userId': user_id, 'message': message})
+
+
+def seed(table, users):
+    for u in range(users):
+        table.put_item(Item={
+            'userID': f'user-{u}', 'dataType': 'user_data', 'formData': form_data(u),
+            'recommendations': {'skills': ['Python']}, 'completedActivities': {}, 'lastUpdated': '2025-01-01T00:00:00'
+        })
+        table.put_item(Item={
+            'userID': f'user-{u}', 'dataType': 'RESUME_DATA',
+            'resumeText': 'Experienced student developer. ' * 100, 'recommendations': {'strengths': ['Python']}
+        })
+    table.calls.clear()
+
+
+# ------------------------------
+# Runner
+# ------------------------------
+
+class Context:
+    def __init__(self):
+        self.aws_request_id = str(uuid.uuid4())
+        self.deadline = time.monotonic() + 30
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.monotonic()) * 1000)
+
+
+def load_handler(path):
+    for directory in (HERE, os.path.dirname(path)):
+        if directory not in sys.path:
+            sys.path.insert(0, directory)
+    spec = importlib.util.spec_from_file_location(os.path.basename(path).replace('-', '_')[:-3], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def run_handler(name, module, table, args):
+    import semantic_cache
+
+    rng = random.Random(args.seed)
+    events = [make_event(name, i, args.users, 1 if i % 2 == 0 else 2, rng) for i in range(args.requests)]
+    table.calls.clear()
+    # Fresh cache per handler; a threshold above 1 never matches, so every
+    # lookup is a miss and the full prompt + Gemini path is measured
+    semantic_cache.answers = semantic_cache.SemanticCache(
+        threshold=float('inf') if args.no_semantic_cache else semantic_cache.SIMILARITY_THRESHOLD
+    )
+
+    def invoke(event):
+        start = time.perf_counter()
+        response = module.lambda_handler(event, Context())
+        elapsed = (time.perf_counter() - start) * 1000
+        return elapsed, response.get('statusCode'), len(event.get('body') or ''), len(response.get('body') or '')
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(invoke, events))
+    wall = time.perf_counter() - started
+
+    latencies = [r[0] for r in results]
+    return {
+        'requests': len(results),
+        'concurrency': args.concurrency,
+        'throughputRps': round(len(results) / wall, 1),
+        'p50Ms': round(percentile(latencies, 50), 2),
+        'p99Ms': round(percentile(latencies, 99), 2),
+        'statusCodes': dict(Counter(r[1] for r in results)),
+        'dynamodbCalls': dict(table.calls),
+        'dynamodbCallsPerRequest': round(sum(table.calls.values()) / len(results), 2),
+        'avgRequestBytes': round(sum(r[2] for r in results) / len(results)),
+        'avgResponseBytes': round(sum(r[3] for r in results) / len(results)),
+        'semanticCache': semantic_cache.answers.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--handlers', nargs='*', default=list(HANDLERS), choices=list(HANDLERS))
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--gemini-latency-ms', type=float, default=50)
+    parser.add_argument('--reply-words', type=int, default=120)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--no-semantic-cache', action='store_true', help='make every chat cache lookup miss')
+    parser.add_argument('--json', action='store_true')
+    parser.add_argument('--verbose', action='store_true', help='show handler logs')
+    args = parser.parse_args()
+
+    server, base_url = start_fake_gemini(args.gemini_latency_ms, args.reply_words)
+    os.environ['GEMINI_API_BASE'] = base_url
+    os.environ.setdefault('GEMINI_API_KEY', 'harness')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+    # Lambdas pick up their table from lambda_runtime at import time
+    sys.path.insert(0, HERE)
+    import lambda_runtime
+    table = FakeTable(lambda_runtime.TABLE_NAME)
+    lambda_runtime._tables[lambda_runtime.TABLE_NAME] = table
+    seed(table, args.users)
+
+    report = {}
+    # Handler logging would dominate the output (and the timings) unless asked for
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+        for name in args.handlers:
+            module = load_handler(HANDLERS[name])
+            report[name] = run_handler(name, module, table, args)
+    server.shutdown()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for name, result in report.items():
+        print(f"{name}: {result['requests']} requests @ {result['concurrency']} concurrent, {result['throughputRps']} req/s")
+        print(f"  latency     p50 {result['p50Ms']} ms   p99 {result['p99Ms']} ms")
+        print(f"  status      {result['statusCodes']}")
+        print(f"  dynamodb    {result['dynamodbCalls']} ({result['dynamodbCallsPerRequest']}/request)")
+        print(f"  body bytes  request {result['avgRequestBytes']}   response {result['avgResponseBytes']}")
+        cache = result['semanticCache']
+        if cache['hits'] or cache['misses'] or cache['bypasses']:
+            print(f"  cache       hit rate {cache['hitRate']:.0%}   {cache['hits']} hits / {cache['misses']} misses / {cache['bypasses']} bypasses")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+import json
+import os
+import random
+import threading
+import time
+
+import urllib3
+
+import lambda_runtime
+import tracing
+
+# Resilience helpers shared by the chat Lambdas: retryable-error
+# classification, jittered backoff bounded by the Lambda deadline, a
+# per-container circuit breaker for Gemini and an optional hedged request to
+# the self-hosted Llama server (deploymodel/llama_server.py).
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+MAX_ATTEMPTS = int(os.environ.get('GEMINI_MAX_ATTEMPTS', '3'))
+BASE_DELAY = float(os.environ.get('GEMINI_BASE_DELAY', '0.25'))
+MAX_DELAY = float(os.environ.get('GEMINI_MAX_DELAY', '2.0'))
+
+# Time kept back from the Lambda deadline for the DynamoDB write and response
+DEADLINE_MARGIN_MS = int(os.environ.get('DEADLINE_MARGIN_MS', '1500'))
+# An attempt with less time than this left is not worth starting
+MIN_ATTEMPT_MS = int(os.environ.get('MIN_ATTEMPT_MS', '1000'))
+# Used when there is no Lambda context (local runs)
+DEFAULT_DEADLINE_MS = 25000
+
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_SECONDS = float(os.environ.get('BREAKER_RESET_SECONDS', '30'))
+
+# Unset disables the fallback; e.g. https://llama-endpoint.resumax.work/generate
+LLAMA_FALLBACK_URL = os.environ.get('LLAMA_FALLBACK_URL', '')
+# Start the Llama request if Gemini has not answered within this many seconds
+HEDGE_AFTER_SECONDS = float(os.environ.get('HEDGE_AFTER_SECONDS', '4'))
+
+http = lambda_runtime.http
+
+
+class UpstreamError(Exception):
+    def __init__(self, message, status=None, retryable=False):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+
+class DeadlineExceeded(UpstreamError):
+    pass
+
+
+def check_response(response, backend):
+    """Raise a classified UpstreamError for any non-200 response."""
+    if response.status != 200:
+        details = response.data.decode('utf-8', errors='replace')[:500]
+        raise UpstreamError(
+            f'{backend} error: {response.status} - {details}',
+            status=response.status,
+            retryable=response.status in RETRYABLE_STATUS
+        )
+
+
+def is_retryable(error):
+    if isinstance(error, UpstreamError):
+        return error.retryable
+    # Timeouts, resets and refused connections; urllib3 wraps these in HTTPError
+    return isinstance(error, (urllib3.exceptions.HTTPError, TimeoutError, ConnectionError))
+
+
+def deadline_from_context(context):
+    """Monotonic time by which upstream calls must be finished."""
+    remaining_ms = DEFAULT_DEADLINE_MS
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        remaining_ms = context.get_remaining_time_in_millis()
+    return time.monotonic() + (remaining_ms - DEADLINE_MARGIN_MS) / 1000.0
+
+
+class CircuitBreaker:
+    """
+    Fails fast after repeated upstream failures.
+
+    closed -> open after failure_threshold consecutive failures; open ->
+    half-open once reset_seconds have passed, letting a single probe
+    through. The probe's outcome closes or re-opens the circuit. State lives
+    at module scope, so it is shared by every invocation in the container.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def release(self):
+        # A probe that ended without a verdict (e.g. a 4xx) lets the next call probe
+        with self.lock:
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.probing:
+                    print(f"Circuit '{self.name}' opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+GEMINI_BREAKER = CircuitBreaker('gemini')
+
+
+def call_with_retry(call, deadline, breaker=None, max_attempts=MAX_ATTEMPTS):
+    """
+    Run call(timeout_seconds) with full-jitter exponential backoff.
+
+    Only retryable errors are retried, and neither an attempt nor a sleep is
+    started if it would run past the deadline. Each attempt's timeout is
+    capped by the time left.
+    """
+    last_error = None
+    for attempt in range(max_attempts):
+        remaining = deadline - time.monotonic()
+        if remaining * 1000 < MIN_ATTEMPT_MS:
+            raise DeadlineExceeded(f'Deadline reached after {attempt} attempts: {last_error}', retryable=False)
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError(f"Circuit '{breaker.name}' is open", retryable=False)
+
+        try:
+            try:
+                result = call(remaining)
+            except Exception as e:
+                last_error = e
+                retryable = is_retryable(e)
+                if breaker is not None and retryable:
+                    breaker.record_failure()
+                if not retryable or attempt == max_attempts - 1:
+                    raise
+                delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * (2 ** attempt)))
+                if (deadline - time.monotonic() - delay) * 1000 < MIN_ATTEMPT_MS:
+                    raise DeadlineExceeded(f'No time left to retry after: {e}', retryable=False) from e
+                print(f"Retry {attempt + 1}/{max_attempts} in {delay:.2f}s after error: {e}")
+            else:
+                if breaker is not None:
+                    breaker.record_success()
+                return result
+        finally:
+            # Never leave a half-open probe claimed, whatever the outcome
+            if breaker is not None:
+                breaker.release()
+        time.sleep(delay)
+
+
+def call_llama(payload, timeout):
+    """POST to the Llama server's /generate route and return its text output."""
+    with tracing.span('llama.generate') as span:
+        response = http.request(
+            'POST',
+            LLAMA_FALLBACK_URL,
+            body=json.dumps(payload).encode('utf-8'),
+            headers=tracing.inject({'Content-Type': 'application/json'}),
+            timeout=urllib3.Timeout(connect=min(2.0, timeout), read=timeout),
+            retries=False
+        )
+        span.set(httpStatus=response.status, responseBytes=len(response.data))
+        check_response(response, 'Llama')
+    output = json.loads(response.data.decode('utf-8')).get('output')
+    if not output:
+        raise UpstreamError('Llama returned an empty output')
+    return output
+
+
+def call_with_fallback(primary, deadline, breaker=GEMINI_BREAKER, fallback_payload=None, hedge_after=HEDGE_AFTER_SECONDS,
+                       discard=None):
+    """
+    Call primary with retries, hedging to the Llama server when configured.
+
+    Returns (result, backend). Without LLAMA_FALLBACK_URL or a payload this
+    is just call_with_retry. Otherwise the Llama request starts as soon as
+    the circuit is open or the primary fails, or after hedge_after seconds
+    if the primary is still running; the first success wins. If the primary
+    succeeds after losing, discard(result) is called on its result, e.g. to
+    release an open stream.
+    """
+    if not LLAMA_FALLBACK_URL or fallback_payload is None:
+        return call_with_retry(primary, deadline, breaker), 'gemini'
+
+    # Only needed when hedging is configured
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+    # Spans opened on the worker threads still belong to this request's trace
+    @tracing.run_in_context
+    def run_fallback():
+        return call_llama(fallback_payload, max(0.1, deadline - time.monotonic()))
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        pending = {}
+        if breaker.state == 'open':
+            pending[executor.submit(run_fallback)] = 'llama'
+        else:
+            pending[executor.submit(tracing.run_in_context(call_with_retry), primary, deadline, breaker)] = 'gemini'
+
+        errors = []
+        hedged = 'llama' in pending.values()
+        while pending:
+            timeout = None if hedged else hedge_after
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                print(f"Hedging to Llama after {hedge_after}s")
+                pending[executor.submit(run_fallback)] = 'llama'
+                hedged = True
+                continue
+            for future in done:
+                backend = pending.pop(future)
+                try:
+                    return future.result(), backend
+                except Exception as e:
+                    print(f"{backend} failed: {e}")
+                    errors.append(e)
+            if not hedged:
+                pending[executor.submit(run_fallback)] = 'llama'
+                hedged = True
+        raise errors[0]
+    finally:
+        if discard is not None:
+            def discard_loser(future):
+                if not future.cancelled() and future.exception() is None:
+                    discard(future.result())
+
+            for future, backend in pending.items():
+                if backend == 'gemini':
+                    future.add_done_callback(discard_loser)
+        # Don't wait for the losing request
+        executor.shutdown(wait=False)
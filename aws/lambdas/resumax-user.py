@@ -1,19 +1,188 @@
+import gzip
+import hashlib
 import json
-import boto3
+import os
 from datetime import datetime
+from decimal import Decimal
+from botocore.exceptions import ClientError
+import lambda_runtime
+import tracing
 
+# Created once per container and reused by warm invocations
+table = lambda_runtime.get_table()
+
+# Recommendations larger than this are stored gzip-compressed as binary
+RECOMMENDATIONS_GZIP_BYTES = int(os.environ.get('RECOMMENDATIONS_GZIP_BYTES', '2048'))
+
+# Serialized GET responses per user; POST/PUT/PATCH invalidate the entry
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '30'))
+user_cache = lambda_runtime.TTLCache(USER_CACHE_TTL_SECONDS)
+
+# Top-level attributes a PATCH may touch
+PATCHABLE_FIELDS = ('formData', 'recommendations', 'completedActivities')
+
+
+def get_user_id(event, body):
+    # Extract user ID from Authorization header (JWT token)
+    user_id = 'authenticated_user'  # Default fallback
+    
+    # Try to get user ID from the authorizer context (if using API Gateway authorizer)
+    if 'requestContext' in event and 'authorizer' in event['requestContext']:
+        authorizer = event['requestContext']['authorizer']
+        # For JWT authorizers, the claims are in 'jwt.claims'
+        if 'jwt' in authorizer and 'claims' in authorizer['jwt']:
+            user_id = authorizer['jwt']['claims'].get('sub') or authorizer['jwt']['claims'].get('cognito:username', 'authenticated_user')
+        # For Lambda authorizers, check principalId
+        elif 'principalId' in authorizer:
+            user_id = authorizer['principalId']
+    
+    # Fallback: check if userId is in the body
+    if user_id == 'authenticated_user' and 'userId' in body:
+        user_id = body.get('userId')
+    
+    return user_id
+
+
+def json_default(value):
+    # DynamoDB returns numbers as Decimal
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def make_etag(user_id, last_updated, recommendations_updated_at=''):
+    # recommendationsUpdatedAt changes when the precompute job writes new
+    # recommendations without touching the user's own lastUpdated
+    digest = hashlib.sha1(f'{user_id}|{last_updated}|{recommendations_updated_at}'.encode('utf-8')).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def get_header(event, name):
+    # REST API (v1) keeps header case; HTTP API (v2) lowercases them
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def encode_recommendations(recommendations):
+    """
+    Return (attribute, value, other_attribute) for storing recommendations.
+
+    Large blobs go to 'recommendationsGz' as gzip-compressed JSON, which is
+    far smaller than the equivalent nested map; the other attribute should
+    be removed so only one representation exists.
+    """
+    raw = json.dumps(recommendations, separators=(',', ':')).encode('utf-8')
+    if len(raw) > RECOMMENDATIONS_GZIP_BYTES:
+        return 'recommendationsGz', gzip.compress(raw, mtime=0), 'recommendations'
+    return 'recommendations', recommendations, 'recommendationsGz'
+
+
+def decode_item(item):
+    """Restore compressed recommendations so clients always see a map."""
+    if 'recommendationsGz' in item:
+        blob = item.pop('recommendationsGz')
+        blob = getattr(blob, 'value', blob)  # boto3 wraps binary in Binary
+        item['recommendations'] = json.loads(gzip.decompress(bytes(blob)))
+    return item
+
+
+def parse_pointer(path):
+    # JSON-pointer style path -> segments, e.g. "/completedActivities/0-1"
+    if not path.startswith('/'):
+        raise ValueError(f'Invalid path: {path}')
+    segments = [part.replace('~1', '/').replace('~0', '~') for part in path[1:].split('/')]
+    if segments[0] not in PATCHABLE_FIELDS or not all(segments):
+        raise ValueError(f'Path not patchable: {path}')
+    if segments[0] == 'recommendations' and len(segments) > 1:
+        # Recommendations may be stored compressed, so they are only replaced whole
+        raise ValueError('recommendations can only be replaced as a whole')
+    return segments
+
+
+def build_patch_update(operations, updated_at):
+    """
+    Turn JSON-patch style operations into an update_item expression.
+
+    Supports add/replace (SET) and remove (REMOVE) on paths under
+    formData, recommendations and completedActivities. The top-level fields
+    are maps, so their direct children are always keys (completedActivities
+    may have a key "3"); deeper numeric segments address list elements, e.g.
+    /formData/skills/0. Overlapping paths in one patch are rejected, since
+    DynamoDB refuses them. Touching formData or recommendations also stamps
+    formDataUpdatedAt / recommendationsUpdatedAt, which the precompute job
+    compares. Returns the update_item keyword arguments.
+    """
+    names = {}
+    values = {':lastUpdated': updated_at}
+    sets = ['lastUpdated = :lastUpdated']
+    removes = []
+
+    def name_for(segment):
+        placeholder = f'#n{len(names)}'
+        for key, value in names.items():
+            if value == segment:
+                return key
+        names[placeholder] = segment
+        return placeholder
+
+    stamped = set()
+    seen_paths = []
+    for index, operation in enumerate(operations):
+        op = operation.get('op')
+        segments = parse_pointer(operation.get('path', ''))
+        for other in seen_paths:
+            shorter = min(len(other), len(segments))
+            if other[:shorter] == segments[:shorter]:
+                raise ValueError(f'Overlapping paths: /{"/".join(other)} and {operation["path"]}')
+        seen_paths.append(segments)
+        if segments[0] in ('formData', 'recommendations') and segments[0] not in stamped:
+            stamped.add(segments[0])
+            sets.append(f'{segments[0]}UpdatedAt = :lastUpdated')
+        expression = name_for(segments[0])
+        for depth, segment in enumerate(segments[1:], start=1):
+            expression += f'[{segment}]' if depth > 1 and segment.isdigit() else f'.{name_for(segment)}'
+
+        if op in ('add', 'replace'):
+            if 'value' not in operation:
+                raise ValueError(f'Missing value for {operation["path"]}')
+            value = operation['value']
+            if segments == ['recommendations']:
+                attribute, value, other = encode_recommendations(value)
+                expression = name_for(attribute)
+                removes.append(name_for(other))
+            values[f':v{index}'] = value
+            sets.append(f'{expression} = :v{index}')
+        elif op == 'remove':
+            removes.append(expression)
+            if segments == ['recommendations']:
+                removes.append(name_for('recommendationsGz'))
+        else:
+            raise ValueError(f'Unsupported op: {op}')
+
+    update_expression = 'SET ' + ', '.join(sets)
+    if removes:
+        update_expression += ' REMOVE ' + ', '.join(removes)
+
+    kwargs = {
+        'UpdateExpression': update_expression,
+        'ExpressionAttributeValues': values
+    }
+    if names:
+        kwargs['ExpressionAttributeNames'] = names
+    return kwargs
+
+@tracing.traced_handler('resumax-user')
 def lambda_handler(event, context):
     # CORS headers for all responses
     cors_headers = {
         'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-        'Access-Control-Allow-Methods': 'GET,POST,PUT,OPTIONS'
+        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,If-None-Match,traceparent',
+        'Access-Control-Allow-Methods': 'GET,POST,PUT,PATCH,OPTIONS',
+        'Access-Control-Expose-Headers': 'ETag,traceparent'
     }
     
-    # Initialize DynamoDB
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table('ResuMAXUsers')
-    
     # Get HTTP method
     http_method = event.get('httpMethod')  # REST API format
     if not http_method and 'requestContext' in event:
@@ -37,30 +206,49 @@ def lambda_handler(event, context):
             query_params = event.get('queryStringParameters') or {}
             user_id = query_params.get('userId', 'authenticated_user')
             
-            # Query DynamoDB for existing data - FIXED: userID not userId
-            response = table.query(
-                KeyConditionExpression=boto3.dynamodb.conditions.Key('userID').eq(user_id)
-            )
+            cached = user_cache.get(user_id)
+            tracing.annotate(cache='hit' if cached else 'miss')
+            if cached is None:
+                # Exact key lookup for the profile item - 0.5 RCU, no partition query
+                response = table.get_item(Key={'userID': user_id, 'dataType': 'user_data'})
+                item = response.get('Item')
+                
+                if not item:
+                    # No data found, return 404 (don't create anything)
+                    return {
+                        'statusCode': 404,
+                        'headers': cors_headers,
+                        'body': json.dumps({'message': 'No user data found', 'userId': user_id})
+                    }
+                
+                with tracing.span('serialize') as span:
+                    user_data = decode_item(item)
+                    cached = {
+                        'etag': make_etag(user_id, user_data.get('lastUpdated', ''), user_data.get('recommendationsUpdatedAt', '')),
+                        'body': json.dumps({
+                            'message': 'User data found',
+                            'userId': user_id,
+                            'data': user_data
+                        }, default=json_default)
+                    }
+                    span.set(bytes=len(cached['body']))
+                user_cache.put(user_id, cached)
             
-            if response['Items']:
-                # User data exists, return it
-                user_data = response['Items'][0]  # Get first item
-                return {
-                    'statusCode': 200,
-                    'headers': cors_headers,
-                    'body': json.dumps({
-                        'message': 'User data found',
-                        'userId': user_id,
-                        'data': user_data
-                    })
-                }
-            else:
-                # No data found, return 404 (don't create anything)
+            # Browsers revalidate with If-None-Match; unchanged data costs no payload
+            headers = {**cors_headers, 'ETag': cached['etag'], 'Cache-Control': 'private, no-cache'}
+            if_none_match = get_header(event, 'if-none-match') or ''
+            if cached['etag'] in [tag.strip().replace('W/', '', 1) for tag in if_none_match.split(',')]:
                 return {
-                    'statusCode': 404,
-                    'headers': cors_headers,
-                    'body': json.dumps({'message': 'No user data found', 'userId': user_id})
+                    'statusCode': 304,
+                    'headers': headers,
+                    'body': ''
                 }
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'body': cached['body']
+            }
         
         elif http_method == 'POST':
             # POST: CREATE/UPDATE data (upsert - no checking needed)
@@ -76,44 +264,34 @@ def lambda_handler(event, context):
             
             body = json.loads(event['body'])
             
-            # Extract user ID from Authorization header (JWT token)
-            user_id = 'authenticated_user'  # Default fallback
-            
-            # Try to get user ID from the authorizer context (if using API Gateway authorizer)
-            if 'requestContext' in event and 'authorizer' in event['requestContext']:
-                authorizer = event['requestContext']['authorizer']
-                # For JWT authorizers, the claims are in 'jwt.claims'
-                if 'jwt' in authorizer and 'claims' in authorizer['jwt']:
-                    user_id = authorizer['jwt']['claims'].get('sub') or authorizer['jwt']['claims'].get('cognito:username', 'authenticated_user')
-                # For Lambda authorizers, check principalId
-                elif 'principalId' in authorizer:
-                    user_id = authorizer['principalId']
-            
-            # Fallback: check if userId is in the body
-            if user_id == 'authenticated_user' and 'userId' in body:
-                user_id = body.get('userId')
-            
-            print(f"👤 Using user ID: {user_id}")
+            user_id = get_user_id(event, body)
             
             # Just save directly - put_item will create OR update
+            rec_attribute, rec_value, _ = encode_recommendations(body.get('recommendations', {}))
+            saved_at = datetime.utcnow().isoformat()
             item = {
                 'userID': user_id,
                 'dataType': 'user_data',
                 'formData': body.get('formData', {}),
-                'recommendations': body.get('recommendations', {}),
+                rec_attribute: rec_value,
                 'completedActivities': body.get('completedActivities', {}),
-                'lastUpdated': datetime.utcnow().isoformat()
+                'lastUpdated': saved_at,
+                # Saved together, so the precompute job sees them as in sync
+                'formDataUpdatedAt': saved_at,
+                'recommendationsUpdatedAt': saved_at
             }
             
             table.put_item(Item=item)  # This creates OR updates - no error!
+            user_cache.invalidate(user_id)
             
+            # The client already has what it sent; don't echo the item back
             return {
                 'statusCode': 200,
                 'headers': cors_headers,
                 'body': json.dumps({
                     'message': 'User data saved successfully',
                     'userId': user_id,
-                    'data': item
+                    'lastUpdated': item['lastUpdated']
                 })
             }
         
@@ -133,10 +311,11 @@ def lambda_handler(event, context):
             user_id = body.get('userId', 'authenticated_user')
             
             # Update existing item in DynamoDB - FIXED: userID not userId
-            update_expression = "SET formData = :formData, recommendations = :recommendations, completedActivities = :completedActivities, lastUpdated = :lastUpdated"
+            rec_attribute, rec_value, rec_other = encode_recommendations(body.get('recommendations', {}))
+            update_expression = f"SET formData = :formData, {rec_attribute} = :recommendations, completedActivities = :completedActivities, lastUpdated = :lastUpdated, formDataUpdatedAt = :lastUpdated, recommendationsUpdatedAt = :lastUpdated REMOVE {rec_other}"
             expression_values = {
                 ':formData': body.get('formData', {}),
-                ':recommendations': body.get('recommendations', {}),
+                ':recommendations': rec_value,
                 ':completedActivities': body.get('completedActivities', {}),
                 ':lastUpdated': datetime.utcnow().isoformat()
             }
@@ -146,13 +325,84 @@ def lambda_handler(event, context):
                 UpdateExpression=update_expression,
                 ExpressionAttributeValues=expression_values
             )
+            user_cache.invalidate(user_id)
             
             return {
                 'statusCode': 200,
                 'headers': cors_headers,
                 'body': json.dumps({
                     'message': 'User data updated successfully',
-                    'userId': user_id
+                    'userId': user_id,
+                    'lastUpdated': expression_values[':lastUpdated']
+                })
+            }
+        
+        elif http_method == 'PATCH':
+            # PATCH: apply a JSON-patch style delta without rewriting whole maps
+            print("PATCH request - applying field-level changes")
+            
+            if not event.get('body'):
+                return {
+                    'statusCode': 400,
+                    'headers': cors_headers,
+                    'body': json.dumps({'message': 'No data provided'})
+                }
+            
+            body = json.loads(event['body'])
+            user_id = get_user_id(event, body)
+            operations = body.get('patch') or []
+            
+            try:
+                if not operations:
+                    raise ValueError('patch must be a non-empty list of operations')
+                updated_at = datetime.utcnow().isoformat()
+                update_kwargs = build_patch_update(operations, updated_at)
+            except (ValueError, AttributeError) as e:
+                return {
+                    'statusCode': 400,
+                    'headers': cors_headers,
+                    'body': json.dumps({'message': f'Invalid patch: {str(e)}'})
+                }
+            
+            key = {'userID': user_id, 'dataType': 'user_data'}
+            try:
+                try:
+                    table.update_item(Key=key, **update_kwargs)
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'ValidationException':
+                        raise
+                    # Retry only if a top-level map the patch writes into is missing
+                    # (e.g. first completed activity); create it and apply the patch again
+                    paths = [parse_pointer(operation['path']) for operation in operations]
+                    nested = sorted({segments[0] for segments in paths if len(segments) > 1})
+                    existing = table.get_item(Key=key, ProjectionExpression=', '.join(nested or ['userID'])).get('Item') or {}
+                    missing = [field for field in nested if field not in existing]
+                    if not missing:
+                        raise
+                    table.update_item(
+                        Key=key,
+                        UpdateExpression='SET ' + ', '.join(f'{field} = if_not_exists({field}, :empty)' for field in missing),
+                        ExpressionAttributeValues={':empty': {}}
+                    )
+                    table.update_item(Key=key, **update_kwargs)
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ValidationException':
+                    raise
+                # The paths don't fit the stored document (e.g. list index out of range)
+                return {
+                    'statusCode': 400,
+                    'headers': cors_headers,
+                    'body': json.dumps({'message': f'Invalid patch: {e.response["Error"].get("Message", "")}'})
+                }
+            user_cache.invalidate(user_id)
+            
+            return {
+                'statusCode': 200,
+                'headers': cors_headers,
+                'body': json.dumps({
+                    'message': 'User data patched successfully',
+                    'userId': user_id,
+                    'lastUpdated': updated_at
                 })
             }
         
@@ -165,8 +415,7 @@ def lambda_handler(event, context):
     
     except Exception as e:
         print(f"Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        lambda_runtime.log_exception()
         return {
             'statusCode': 500,
             'headers': cors_headers,
@@ -0,0 +1,180 @@
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+# Per-container semantic cache for chatbot answers.
+#
+# Many questions are near-duplicates across users with similar profiles
+# ("how do I get an internship at X"). Questions are embedded locally with
+# hashed word/bigram/character-trigram features (no model or network call),
+# partitioned by a coarse profile signature (major + desired occupation) and
+# matched by cosine similarity. Cached answers must be generated from nothing
+# more than the signature fields, since they are served to other users.
+# Questions about the user's own resume or that continue the conversation
+# ("what about the second one?") bypass the cache.
+
+SIMILARITY_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.9'))
+TTL_SECONDS = float(os.environ.get('SEMANTIC_CACHE_TTL_SECONDS', '21600'))
+MAX_ENTRIES = int(os.environ.get('SEMANTIC_CACHE_MAX_ENTRIES', '512'))
+DIMENSIONS = 1 << 16
+
+STOPWORDS = {
+    'a', 'an', 'the', 'i', 'me', 'to', 'of', 'for', 'in', 'on', 'at', 'and', 'or',
+    'is', 'are', 'do', 'does', 'can', 'could', 'should', 'would', 'what', 'how',
+    'please', 'hi', 'hey', 'thanks', 'be', 'it', 'with', 'as', 'some', 'any',
+}
+
+# Any first-person reference to the user's own data or situation ("my action
+# plan", "what should I focus on", "am I ready") makes an answer user-specific.
+# Plain how-to questions ("how do I prepare for interviews", "what should I
+# learn for SWE") stay shareable.
+PERSONAL_RE = re.compile(
+    r"\b(my|mine|me|myself|i'm|im|i've|i'd|i am|i have|i had|i was|i worked|i did|i took)\b"
+    r"|\b(should|shall|can|could|would|will|do|did|have) i\b"
+    r"(?! (get|find|prepare|write|apply|start|become|learn|study|practice|build|network|negotiate)\b)"
+    r"|\bam i\b",
+    re.I
+)
+# Follow-ups only make sense with the conversation history
+FOLLOW_UP_RE = re.compile(
+    r"^(and|also|what about|how about|why|ok|okay|so)\b"
+    r"|\b(that one|the (first|second|third|last) one|you (said|mentioned)|above|earlier|more detail)\b",
+    re.I
+)
+
+
+def normalize_question(text):
+    words = re.findall(r"[a-z0-9+#]+", (text or '').lower())
+    return ' '.join(word for word in words if word not in STOPWORDS)
+
+
+def profile_signature(profile):
+    profile = profile or {}
+    major = normalize_question(profile.get('major', ''))
+    occupation = normalize_question(profile.get('desiredOccupation', ''))
+    return f"{major}|{occupation}"
+
+
+def _feature(text):
+    return zlib.crc32(text.encode('utf-8')) % DIMENSIONS
+
+
+def embed(normalized):
+    """Sparse L2-normalized vector of hashed word, bigram and char-trigram features."""
+    vector = {}
+    words = normalized.split()
+    features = [(w, 1.0) for w in words]
+    features += [(f"{a} {b}", 1.0) for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"#{word}#"
+        features += [(padded[i:i + 3], 0.3) for i in range(len(padded) - 2)]
+    for text, weight in features:
+        index = _feature(text)
+        vector[index] = vector.get(index, 0.0) + weight
+    norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+    return {k: v / norm for k, v in vector.items()}
+
+
+def cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(key, 0.0) for key, value in a.items())
+
+
+def should_bypass(question):
+    return bool(PERSONAL_RE.search(question or '') or FOLLOW_UP_RE.search((question or '').strip()))
+
+
+class SemanticCache:
+    """
+    In-memory nearest-neighbour cache with LRU and TTL eviction.
+
+    lookup() returns (status, answer) where status is 'hit', 'miss' or
+    'bypass'. store() records an answer together with how long it took to
+    generate, which is what each later hit is counted as saving.
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, ttl=TTL_SECONDS, max_entries=MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.saved_ms = 0.0
+        self.next_id = 0
+
+    def lookup(self, question, signature):
+        if should_bypass(question):
+            with self.lock:
+                self.bypasses += 1
+            return 'bypass', None
+
+        normalized = normalize_question(question)
+        vector = embed(normalized)
+        now = time.monotonic()
+        best_id, best_score = None, 0.0
+        with self.lock:
+            for entry_id, entry in list(self.entries.items()):
+                if now >= entry['expires_at']:
+                    del self.entries[entry_id]
+                    continue
+                if entry['signature'] != signature:
+                    continue
+                score = 1.0 if entry['normalized'] == normalized else cosine(vector, entry['vector'])
+                if score > best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is not None and best_score >= self.threshold:
+                entry = self.entries[best_id]
+                self.entries.move_to_end(best_id)
+                self.hits += 1
+                self.saved_ms += entry['latency_ms']
+                return 'hit', entry['answer']
+            self.misses += 1
+            return 'miss', None
+
+    def store(self, question, signature, answer, latency_ms, private_terms=()):
+        """Cache an answer unless it is user-specific or mentions private_terms."""
+        if should_bypass(question) or not answer:
+            return False
+        lowered = answer.lower()
+        if any(term and term.lower() in lowered for term in private_terms):
+            return False
+
+        normalized = normalize_question(question)
+        with self.lock:
+            self.entries[self.next_id] = {
+                'signature': signature,
+                'normalized': normalized,
+                'vector': embed(normalized),
+                'answer': answer,
+                'latency_ms': latency_ms,
+                'expires_at': time.monotonic() + self.ttl
+            }
+            self.next_id += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return True
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'bypasses': self.bypasses,
+                'hitRate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'savedMs': round(self.saved_ms),
+                'entries': len(self.entries)
+            }
+
+
+# Shared by every invocation in the container
+answers = SemanticCache()
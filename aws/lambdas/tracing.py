@@ -0,0 +1,301 @@
+import contextlib
+import contextvars
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+# Lightweight request tracing shared by the Lambdas and the Llama server.
+#
+# A trace is started per request from the W3C traceparent header (or a new
+# trace id), spans are timed around DynamoDB, LLM calls, prompt building and
+# serialization, and the outgoing traceparent is forwarded to the next hop.
+# Each finished trace is one JSON log line; sampled traces can also be sent
+# as OTLP/JSON to a local collector (OpenTelemetry Collector, Jaeger) over
+# HTTP or appended to a file for the collector's otlpjsonfile receiver.
+# Stdlib only, so every service can use it without extra dependencies.
+# deploymodel/package_server.sh bundles this file with the Llama server.
+
+# Share of requests logged when the caller did not ask for sampling
+SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.1'))
+# Slow and failed requests are always logged
+SLOW_MS = float(os.environ.get('TRACE_SLOW_MS', '3000'))
+# e.g. http://localhost:4318/v1/traces
+EXPORT_URL = os.environ.get('TRACE_EXPORT_URL', '')
+EXPORT_FILE = os.environ.get('TRACE_EXPORT_FILE', '')
+EXPORT_TIMEOUT = float(os.environ.get('TRACE_EXPORT_TIMEOUT', '0.5'))
+
+TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+_current = contextvars.ContextVar('tracing_current', default=None)
+_export_lock = threading.Lock()
+
+
+def _new_id(nbytes):
+    return '%0*x' % (nbytes * 2, random.getrandbits(nbytes * 8))
+
+
+class Span:
+    __slots__ = ('name', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attrs', 'error')
+
+    def __init__(self, name, parent_id, attrs):
+        self.name = name
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attrs = attrs
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class _NoopSpan:
+    def set(self, **attrs):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    def __init__(self, service, name, traceparent=None, attrs=None):
+        match = TRACEPARENT_RE.match((traceparent or '').strip().lower())
+        if match:
+            self.trace_id, remote_parent, flags = match.groups()
+            upstream_sampled = bool(int(flags, 16) & 1)
+        else:
+            self.trace_id, remote_parent, upstream_sampled = _new_id(16), None, False
+        self.sampled = upstream_sampled or random.random() < SAMPLE_RATE
+        self.service = service
+        self.lock = threading.Lock()
+        self.root = Span(name, remote_parent, dict(attrs or {}))
+        self.spans = [self.root]
+
+    def add(self, span):
+        with self.lock:
+            self.spans.append(span)
+
+    def header(self, span=None):
+        """traceparent value naming span (default: the root) as the parent."""
+        return f"00-{self.trace_id}-{(span or self.root).span_id}-{'01' if self.sampled else '00'}"
+
+
+def start_trace(service, name, headers=None, **attrs):
+    """Begin a request trace and make its root span current."""
+    trace = Trace(service, name, get_header(headers, 'traceparent'), attrs)
+    _current.set((trace, trace.root))
+    return trace
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """Time a block as a child of the current span; a no-op outside a trace."""
+    current = _current.get()
+    if current is None:
+        yield NOOP_SPAN
+        return
+    trace, parent = current
+    child = Span(name, parent.span_id, attrs)
+    token = _current.set((trace, child))
+    try:
+        yield child
+    except Exception as e:
+        child.error = f'{type(e).__name__}: {e}'[:200]
+        raise
+    finally:
+        child.end_ns = time.time_ns()
+        _current.reset(token)
+        trace.add(child)
+
+
+def annotate(**attrs):
+    """Add attributes to the current request's root span."""
+    current = _current.get()
+    if current is not None:
+        current[0].root.set(**attrs)
+
+
+def traceparent():
+    """traceparent header value for a call made from the current span."""
+    current = _current.get()
+    if current is None:
+        return None
+    trace, active = current
+    return trace.header(active)
+
+
+def inject(headers):
+    """Return headers with traceparent added for an outgoing request."""
+    value = traceparent()
+    return {**headers, 'traceparent': value} if value else headers
+
+
+def run_in_context(fn):
+    """Wrap fn so spans it opens on another thread join the current trace."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def get_header(headers, name):
+    # REST API (v1) keeps header case; HTTP API (v2) lowercases them
+    for key, value in (headers or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def finish_trace(trace, status=None, error=None):
+    """End the root span and emit the trace if it is sampled, slow or failed."""
+    root = trace.root
+    root.end_ns = time.time_ns()
+    root.attrs['status'] = status
+    if error is not None:
+        root.error = f'{type(error).__name__}: {error}'[:200]
+    _current.set(None)
+
+    failed = root.error is not None or (status or 0) >= 500
+    if not (trace.sampled or failed or root.duration_ms >= SLOW_MS):
+        return
+    # One write per record so lines from concurrent requests don't interleave
+    sys.stdout.write(json.dumps(log_record(trace), separators=(',', ':'), default=str) + '\n')
+    if EXPORT_URL or EXPORT_FILE:
+        export(trace)
+
+
+def log_record(trace):
+    root = trace.root
+    return {
+        'type': 'trace',
+        'traceId': trace.trace_id,
+        'service': trace.service,
+        'name': root.name,
+        'durationMs': round(root.duration_ms, 2),
+        'status': root.attrs.get('status'),
+        'error': root.error,
+        'sampled': trace.sampled,
+        'spans': [
+            {
+                'name': s.name,
+                'spanId': s.span_id,
+                'parentSpanId': s.parent_id,
+                'offsetMs': round((s.start_ns - root.start_ns) / 1e6, 2),
+                'durationMs': round(s.duration_ms, 2),
+                **({'error': s.error} if s.error else {}),
+                **s.attrs
+            }
+            for s in trace.spans if s is not root
+        ]
+    }
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(trace):
+    """OTLP/JSON ExportTraceServiceRequest for one trace."""
+    spans = []
+    for s in trace.spans:
+        otlp_span = {
+            'traceId': trace.trace_id,
+            'spanId': s.span_id,
+            'name': s.name,
+            'kind': 2 if s is trace.root else 1,  # SERVER / INTERNAL
+            'startTimeUnixNano': str(s.start_ns),
+            'endTimeUnixNano': str(s.end_ns or time.time_ns()),
+            'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in s.attrs.items() if v is not None],
+            'status': {'code': 2, 'message': s.error} if s.error else {'code': 1}
+        }
+        if s.parent_id:
+            otlp_span['parentSpanId'] = s.parent_id
+        spans.append(otlp_span)
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': trace.service}}]},
+            'scopeSpans': [{'scope': {'name': 'resumax.tracing'}, 'spans': spans}]
+        }]
+    }
+
+
+def export(trace):
+    # Synchronous with a short timeout: a Lambda may be frozen right after it returns
+    payload = json.dumps(to_otlp(trace), separators=(',', ':'))
+    try:
+        if EXPORT_FILE:
+            with _export_lock, open(EXPORT_FILE, 'a') as f:
+                f.write(payload + '\n')
+        if EXPORT_URL:
+            import urllib.request
+
+            request = urllib.request.Request(
+                EXPORT_URL, data=payload.encode('utf-8'), headers={'Content-Type': 'application/json'}
+            )
+            urllib.request.urlopen(request, timeout=EXPORT_TIMEOUT).close()
+    except Exception as e:
+        print(f"Trace export failed: {e}")
+
+
+def traced_handler(service):
+    """
+    Decorator for API Gateway Lambda handlers (v1 and v2 events).
+
+    Starts a trace from the request headers, records the response status and
+    returns the traceparent to the client so a slow request can be looked up.
+    """
+    def decorate(handler):
+        def wrapper(event, context):
+            method = event.get('httpMethod') or event.get('requestContext', {}).get('http', {}).get('method', 'POST')
+            trace = start_trace(
+                service, f'{service} {method}', event.get('headers'),
+                method=method, requestId=getattr(context, 'aws_request_id', None)
+            )
+            try:
+                response = handler(event, context)
+            except Exception as e:
+                finish_trace(trace, 500, e)
+                raise
+            response['headers'] = {
+                **(response.get('headers') or {}),
+                'traceparent': trace.header()
+            }
+            finish_trace(trace, response.get('statusCode'))
+            return response
+        wrapper.__name__ = handler.__name__
+        wrapper.__doc__ = handler.__doc__
+        return wrapper
+    return decorate
+
+
+class TracedTable:
+    """Table proxy that wraps each DynamoDB call in a span."""
+
+    OPERATIONS = ('get_item', 'put_item', 'update_item', 'delete_item', 'query', 'scan')
+
+    def __init__(self, table):
+        self._table = table
+
+    def __getattr__(self, name):
+        attr = getattr(self._table, name)
+        if name not in self.OPERATIONS:
+            return attr
+
+        def call(*args, **kwargs):
+            key = kwargs.get('Key') or kwargs.get('Item') or {}
+            with span(f'dynamodb.{name}', dataType=key.get('dataType')):
+                return attr(*args, **kwargs)
+        return call
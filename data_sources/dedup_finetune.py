@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate removal for the fine-tuning dataset (MinHash + LSH).
+
+Generated advising data contains many near-identical prompt/completion
+pairs. Training on all of them costs compute and skews the adapter toward
+the repeated answers, so this runs before train_lora_llama.py:
+
+1. The JSONL is streamed in chunks to a pool of worker processes. Each row's
+   prompt + completion is normalized, split into word n-gram shingles and
+   turned into a MinHash signature; the signature is cut into LSH bands.
+   Signatures go to an on-disk memmap and band keys to one spill file per
+   band, so memory stays bounded by the chunk size, not the dataset size.
+2. Each band file is sorted on its own; rows sharing a bucket are compared
+   by signature agreement (estimated Jaccard similarity) and merged with
+   union-find when they reach --threshold.
+3. The input is streamed again and only the first row of every cluster is
+   written, as shards of --shard-size rows. A report of cluster sizes and
+   the largest clusters is written next to the shards.
+
+    python dedup_finetune.py finetune_ready.jsonl --out-dir finetune_dedup
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import zlib
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64(0xFFFFFFFF)
+BAND_DTYPE = np.dtype([('key', '<u8'), ('row', '<u8')])
+
+
+def normalize(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def shingles(words, ngram):
+    if len(words) <= ngram:
+        return {' '.join(words)}
+    return {' '.join(words[i:i + ngram]) for i in range(len(words) - ngram + 1)}
+
+
+def permutations(num_perm, seed):
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def minhash(text, ngram, a, b):
+    hashes = np.array([zlib.crc32(s.encode('utf-8')) for s in shingles(normalize(text), ngram)], dtype=np.uint64)
+    # Universal hashing (a*x + b) mod p, truncated to 32 bits; minimum per permutation
+    return (((hashes[:, None] * a + b) % MERSENNE_PRIME) & MAX_HASH).min(axis=0).astype(np.uint32)
+
+
+def process_chunk(args):
+    """Worker: signatures and LSH band keys for a list of raw JSONL lines."""
+    lines, ngram, num_perm, bands, seed = args
+    a, b = permutations(num_perm, seed)
+    rows = num_perm // bands
+    band_coefs = permutations(rows, seed + 1)[0]
+
+    signatures = np.zeros((len(lines), num_perm), dtype=np.uint32)
+    valid = np.zeros(len(lines), dtype=bool)
+    for i, line in enumerate(lines):
+        try:
+            example = json.loads(line)
+            text = f"{example['prompt']} {example['completion']}"
+        except (ValueError, KeyError, TypeError):
+            continue
+        signatures[i] = minhash(text, ngram, a, b)
+        valid[i] = True
+
+    # One 64-bit key per band: random linear combination of the band's rows
+    banded = signatures[:, :bands * rows].astype(np.uint64).reshape(len(lines), bands, rows)
+    keys = (banded * band_coefs).sum(axis=2)
+    return signatures, keys, valid
+
+
+def read_chunks(path, chunk_size):
+    chunk = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+# ------------------------------
+# 1. Signatures (parallel, spilled to disk)
+# ------------------------------
+
+def compute_signatures(args, work_dir):
+    signature_path = os.path.join(work_dir, 'signatures.bin')
+    band_files = [open(os.path.join(work_dir, f'band-{band:03d}.bin'), 'wb') for band in range(args.bands)]
+    valid_parts = []
+    total = 0
+
+    def collect(result):
+        nonlocal total
+        signatures, keys, valid = result
+        signatures.tofile(signature_file)
+        row_ids = np.arange(total, total + len(valid), dtype=np.uint64)[valid]
+        for band, band_file in enumerate(band_files):
+            records = np.empty(len(row_ids), dtype=BAND_DTYPE)
+            records['key'] = keys[valid, band]
+            records['row'] = row_ids
+            records.tofile(band_file)
+        valid_parts.append(valid)
+        total += len(valid)
+
+    with open(signature_path, 'wb') as signature_file, ProcessPoolExecutor(max_workers=args.workers) as executor:
+        # Only a few chunks in flight at a time so memory doesn't grow with the input
+        pending = deque()
+        for chunk in read_chunks(args.input, args.chunk_size):
+            pending.append(executor.submit(process_chunk, (chunk, args.ngram, args.num_perm, args.bands, args.seed)))
+            if len(pending) >= 2 * args.workers:
+                collect(pending.popleft().result())
+        while pending:
+            collect(pending.popleft().result())
+
+    for band_file in band_files:
+        band_file.close()
+    valid = np.concatenate(valid_parts) if valid_parts else np.zeros(0, dtype=bool)
+    return signature_path, [f.name for f in band_files], valid
+
+
+# ------------------------------
+# 2. LSH buckets -> clusters
+# ------------------------------
+
+def find(parent, row):
+    while parent[row] != row:
+        parent[row] = parent[parent[row]]
+        row = parent[row]
+    return row
+
+
+def union(parent, a, b):
+    root_a, root_b = find(parent, a), find(parent, b)
+    if root_a != root_b:
+        # The earliest row stays the representative
+        parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+def cluster(signature_path, band_paths, total, num_perm, threshold):
+    parent = np.arange(total, dtype=np.int64)
+    if total == 0:
+        return parent, 0
+    signatures = np.memmap(signature_path, dtype=np.uint32, mode='r', shape=(total, num_perm))
+    compared = 0
+    for path in band_paths:
+        records = np.fromfile(path, dtype=BAND_DTYPE)
+        records = records[np.argsort(records['key'], kind='stable')]
+        if len(records) < 2:
+            continue
+        starts = np.flatnonzero(np.r_[True, records['key'][1:] != records['key'][:-1]])
+        ends = np.r_[starts[1:], len(records)]
+        for start, end in zip(starts[ends - starts > 1], ends[ends - starts > 1]):
+            rows = records['row'][start:end].astype(np.int64)
+            similarity = (signatures[rows[1:]] == signatures[rows[0]]).mean(axis=1)
+            compared += len(rows) - 1
+            for row in rows[1:][similarity >= threshold]:
+                union(parent, rows[0], row)
+    for row in range(total):
+        parent[row] = find(parent, row)
+    return parent, compared
+
+
+# ------------------------------
+# 3. Write shards + report
+# ------------------------------
+
+def write_shards(input_path, out_dir, roots, valid, shard_size, top_clusters):
+    sizes = np.bincount(roots[valid], minlength=len(roots)) if len(roots) else np.zeros(0, dtype=np.int64)
+    largest = [int(r) for r in np.argsort(-sizes, kind='stable')[:top_clusters] if sizes[r] > 1]
+    samples = {}
+    shards = []
+    shard = None
+    kept = 0
+    row = 0
+    with open(input_path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            if valid[row] and roots[row] == row:
+                if kept % shard_size == 0:
+                    if shard:
+                        shard.close()
+                    shards.append(os.path.join(out_dir, f'train-{len(shards):05d}.jsonl'))
+                    shard = open(shards[-1], 'w', encoding='utf-8')
+                shard.write(line if line.endswith('\n') else line + '\n')
+                kept += 1
+                if row in largest:
+                    samples[row] = json.loads(line)['prompt'][:200]
+            row += 1
+    if shard:
+        shard.close()
+
+    cluster_sizes = Counter(int(size) for size in sizes[sizes > 0])
+    return shards, kept, {
+        'clusterSizeHistogram': {str(size): count for size, count in sorted(cluster_sizes.items())},
+        'largestClusters': [{'row': r, 'size': int(sizes[r]), 'prompt': samples.get(r, '')} for r in largest]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', nargs='?', default='finetune_ready.jsonl')
+    parser.add_argument('--out-dir', default='finetune_dedup')
+    parser.add_argument('--threshold', type=float, default=0.8, help='estimated Jaccard similarity for duplicates')
+    parser.add_argument('--num-perm', type=int, default=128)
+    parser.add_argument('--bands', type=int, default=16, help='LSH bands; rows per band = num-perm / bands')
+    parser.add_argument('--ngram', type=int, default=5, help='word shingle size')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=5000, help='rows per worker task')
+    parser.add_argument('--shard-size', type=int, default=100000, help='rows per output shard')
+    parser.add_argument('--tmp-dir', help='spill directory (default: system temp)')
+    parser.add_argument('--top-clusters', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    if args.num_perm % args.bands:
+        parser.error('--num-perm must be divisible by --bands')
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    for old in os.listdir(args.out_dir):
+        if re.match(r'train-\d{5}\.jsonl$', old):
+            os.remove(os.path.join(args.out_dir, old))
+
+    started = time.time()
+    work_dir = tempfile.mkdtemp(prefix='dedup-', dir=args.tmp_dir)
+    try:
+        signature_path, band_paths, valid = compute_signatures(args, work_dir)
+        total = len(valid)
+        print(f"Signed {total} rows in {time.time() - started:.1f}s with {args.workers} workers")
+
+        roots, compared = cluster(signature_path, band_paths, total, args.num_perm, args.threshold)
+        print(f"Clustered in {time.time() - started:.1f}s ({compared} candidate comparisons)")
+
+        shards, kept, clusters = write_shards(args.input, args.out_dir, roots, valid, args.shard_size, args.top_clusters)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    invalid = int(total - valid.sum())
+    report = {
+        'input': args.input,
+        'rows': total,
+        'invalidRows': invalid,
+        'kept': kept,
+        'removed': total - invalid - kept,
+        'redundancy': round((total - invalid - kept) / max(1, total - invalid), 4),
+        'threshold': args.threshold,
+        'numPerm': args.num_perm,
+        'bands': args.bands,
+        'ngram': args.ngram,
+        'shards': [os.path.basename(s) for s in shards],
+        'seconds': round(time.time() - started, 1),
+        **clusters
+    }
+    with open(os.path.join(args.out_dir, 'dedup_report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Kept {kept} of {total - invalid} rows ({report['redundancy']:.1%} near-duplicates, {invalid} invalid) in {len(shards)} shards -> {args.out_dir}")
+
+
+if __name__ == '__main__':
+    main()
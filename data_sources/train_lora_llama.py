@@ -4,6 +4,8 @@ Instruction-style LoRA fine-tuning for LLaMA 3.1 8B
 Requirements: Python >=3.10, PyTorch >=2.0
 """
 
+import glob
+
 import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM, Trainer, TrainingArguments, DataCollatorForSeq2Seq
 from datasets import load_dataset
@@ -44,8 +46,10 @@ if torch.__version__ >= "2.0":
 # ------------------------------
 # 3. Load Dataset
 # ------------------------------
-dataset_path = "finetune_ready.jsonl"
-dataset = load_dataset("json", data_files={"train": dataset_path})
+# Near-duplicates are removed by dedup_finetune.py; fall back to the raw file
+dataset_files = sorted(glob.glob("finetune_dedup/train-*.jsonl")) or "finetune_ready.jsonl"
+print(f"Training on {dataset_files}")
+dataset = load_dataset("json", data_files={"train": dataset_files})
 
 def tokenize_fn(example):
     # Combine prompt + completion
@@ -0,0 +1,393 @@
+"""
+Schema-constrained JSON generation for the recommendations endpoint.
+
+Instead of letting the model write free-form prose (and spending tokens on
+JSON punctuation it may get wrong), the decoder walks the schema itself:
+keys, brackets and separators are forced into the KV cache without
+sampling, string values are sampled with a logits mask that forbids
+quotes, backslashes and newlines until the model closes the string, and at
+the end of each array item the model only chooses between "," and "]".
+The result is built as a Python object while decoding, so it never needs
+re-parsing and can't be malformed.
+"""
+
+import json
+
+import torch
+
+# Mirrors the recommendations shape the app stores in DynamoDB and renders
+# (ActionPlan.jsx phases with tasks, classes, skills, strengths/gaps); every
+# field ActionPlan.jsx reads is generated.
+# Strings are limited in tokens, arrays in items. actionPlan comes first so
+# it is never the field left empty when a smaller budget runs out.
+RECOMMENDATIONS_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'actionPlan': {
+            'type': 'array',
+            'maxItems': 3,
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'phase': {'type': 'string', 'maxTokens': 12},
+                    'priority': {'type': 'string', 'maxTokens': 6},
+                    'duration': {'type': 'string', 'maxTokens': 8},
+                    'tasks': {
+                        'type': 'array',
+                        'maxItems': 4,
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'title': {'type': 'string', 'maxTokens': 16},
+                                'description': {'type': 'string', 'maxTokens': 48},
+                                'effort': {'type': 'string', 'maxTokens': 4},
+                                'deadline': {'type': 'string', 'maxTokens': 8},
+                                'impact': {'type': 'string', 'maxTokens': 20},
+                                'resources': {'type': 'array', 'maxItems': 3, 'items': {'type': 'string', 'maxTokens': 10}}
+                            }
+                        }
+                    }
+                }
+            }
+        },
+        'strengths': {'type': 'array', 'maxItems': 4, 'items': {'type': 'string', 'maxTokens': 32}},
+        'gaps': {'type': 'array', 'maxItems': 4, 'items': {'type': 'string', 'maxTokens': 32}},
+        'skills': {'type': 'array', 'maxItems': 6, 'items': {'type': 'string', 'maxTokens': 12}},
+        'classes': {'type': 'array', 'maxItems': 5, 'items': {'type': 'string', 'maxTokens': 16}}
+    }
+}
+
+JSON_INSTRUCTIONS = (
+    "\nRespond only with JSON containing an actionPlan of phases (phase name, priority, "
+    "duration, tasks with title, description, effort, deadline, impact and resources), "
+    "strengths, gaps, skills and classes.\n"
+)
+
+_string_masks = {}
+
+
+def max_sampled_tokens(schema):
+    """Most tokens the decoder can sample for schema when every cap is filled."""
+    kind = schema['type']
+    if kind == 'string':
+        return schema.get('maxTokens', 32)
+    if kind == 'object':
+        return sum(max_sampled_tokens(sub_schema) for sub_schema in schema['properties'].values())
+    if kind == 'array':
+        return schema.get('maxItems', 8) * max_sampled_tokens(schema['items'])
+    raise ValueError(f'Unsupported schema type: {kind}')
+
+
+def string_token_mask(tokenizer, vocab_size, device):
+    """
+    Boolean mask of tokens allowed inside a JSON string value.
+
+    Built once per tokenizer: decodes every token and rejects special tokens
+    and anything containing a quote, backslash or newline.
+    """
+    key = (id(tokenizer), vocab_size, str(device))
+    if key not in _string_masks:
+        special = set(tokenizer.all_special_ids)
+        allowed = torch.zeros(vocab_size, dtype=torch.bool)
+        for token_id in range(min(vocab_size, len(tokenizer))):
+            if token_id in special:
+                continue
+            text = tokenizer.decode([token_id])
+            allowed[token_id] = bool(text) and not any(c in text for c in '"\\\n\r')
+        _string_masks[key] = allowed.to(device)
+    return _string_masks[key]
+
+
+def sample_token(logits, temperature):
+    if temperature <= 0:
+        return int(torch.argmax(logits))
+    probs = torch.softmax(logits / temperature, dim=-1)
+    return int(torch.multinomial(probs, 1))
+
+
+def walk(schema, budget_left):
+    """
+    Walk schema as a generator shared by both decoders.
+
+    Yields ('force', text), ('string', max_tokens) and ('choose', options)
+    requests; the driver sends back the decoded string or the chosen index.
+    Returns the value built for schema.
+    """
+    kind = schema['type']
+    if kind == 'string':
+        return (yield ('string', schema.get('maxTokens', 32)))
+    if kind == 'object':
+        result = {}
+        yield ('force', '{')
+        for index, (key, sub_schema) in enumerate(schema['properties'].items()):
+            yield ('force', ('' if index == 0 else ', ') + json.dumps(key) + ': ')
+            result[key] = yield from walk(sub_schema, budget_left)
+        yield ('force', '}')
+        return result
+    if kind == 'array':
+        items = []
+        yield ('force', '[')
+        while True:
+            items.append((yield from walk(schema['items'], budget_left)))
+            if len(items) >= schema.get('maxItems', 8) or not budget_left():
+                yield ('force', ']')
+                break
+            if (yield ('choose', [', ', ']'])) == 1:
+                break
+        return items
+    raise ValueError(f'Unsupported schema type: {kind}')
+
+
+class SchemaDecoder:
+    def __init__(self, model, tokenizer, temperature=0.3, max_new_tokens=768):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.temperature = temperature
+        self.max_new_tokens = max_new_tokens
+        self.past = None
+        self.logits = None
+        self.pending = ''
+        self.sampled_tokens = 0
+        self.forced_tokens = 0
+        self.quote_id = self._single_token('"')
+
+    def _single_token(self, text):
+        ids = self.tokenizer.encode(text, add_special_tokens=False)
+        return ids[0]
+
+    def _feed(self, ids):
+        input_ids = torch.tensor([ids], device=self.model.device)
+        with torch.inference_mode():
+            out = self.model(input_ids=input_ids, past_key_values=self.past, use_cache=True)
+        self.past = out.past_key_values
+        self.logits = out.logits[0, -1].float()
+
+    def force(self, text):
+        # Forced text is buffered and fed in one forward pass when logits are needed
+        self.pending += text
+
+    def _next_logits(self):
+        if self.pending:
+            ids = self.tokenizer.encode(self.pending, add_special_tokens=False)
+            self.forced_tokens += len(ids)
+            self.pending = ''
+            self._feed(ids)
+        return self.logits
+
+    def _sample(self, logits):
+        return sample_token(logits, self.temperature)
+
+    def _budget_left(self):
+        return self.sampled_tokens < self.max_new_tokens
+
+    def start(self, prompt):
+        ids = self.tokenizer.encode(prompt)
+        self._feed(ids)
+
+    def choose(self, options):
+        """Let the model pick one of the forced options by its first token."""
+        logits = self._next_logits()
+        first_ids = [self.tokenizer.encode(option, add_special_tokens=False)[0] for option in options]
+        index = int(torch.argmax(logits[first_ids]))
+        self.force(options[index])
+        return index
+
+    def string(self, max_tokens):
+        self.force('"')
+        logits = self._next_logits()
+        mask = string_token_mask(self.tokenizer, logits.shape[-1], logits.device).clone()
+        mask[self.quote_id] = True
+        ids = []
+        while len(ids) < max_tokens and self._budget_left():
+            logits = self._next_logits()
+            token_id = self._sample(logits.masked_fill(~mask, float('-inf')))
+            self.sampled_tokens += 1
+            self._feed([token_id])
+            if token_id == self.quote_id:
+                break
+            ids.append(token_id)
+        else:
+            self.force('"')
+        return self.tokenizer.decode(ids).strip()
+
+    def value(self, schema):
+        steps = walk(schema, self._budget_left)
+        reply = None
+        try:
+            while True:
+                kind, arg = steps.send(reply)
+                if kind == 'force':
+                    self.force(arg)
+                    reply = None
+                elif kind == 'string':
+                    reply = self.string(arg)
+                else:
+                    reply = self.choose(arg)
+        except StopIteration as done:
+            return done.value
+
+
+class _Row:
+    """Decoding state of one sequence in a BatchSchemaDecoder."""
+
+    def __init__(self, schema, max_new_tokens):
+        self.max_new_tokens = max_new_tokens
+        self.steps = walk(schema, self.budget_left)
+        self.text = ''  # forced text not yet tokenized
+        self.queue = []  # forced token ids, fed one per step
+        self.request = None  # ('string', max_tokens) or ('choose', options) waiting for logits
+        self.string_ids = None  # tokens sampled into the open string
+        self.string_max = 0
+        self.sampled_tokens = 0
+        self.forced_tokens = 0
+        self.result = None
+        self.done = False
+
+    def budget_left(self):
+        return self.sampled_tokens < self.max_new_tokens
+
+
+class BatchSchemaDecoder:
+    """
+    SchemaDecoder for many prompts at once.
+
+    The prompts are left-padded into one batch that shares a KV cache. Every
+    forward pass advances each row by one token, which is forced or sampled
+    depending on where that row is in the schema, so rows can be at different
+    fields (and finish at different times) without leaving the batch.
+    """
+
+    def __init__(self, model, tokenizer, temperature=0.3, max_new_tokens=768):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.temperature = temperature
+        self.max_new_tokens = max_new_tokens
+        self.quote_id = tokenizer.encode('"', add_special_tokens=False)[0]
+        self.mask = None
+
+    def _advance(self, row, reply):
+        # Run the row's walk until it needs logits; forced text is buffered
+        try:
+            while True:
+                kind, arg = row.steps.send(reply)
+                reply = None
+                if kind == 'force':
+                    row.text += arg
+                    continue
+                if kind == 'string':
+                    row.text += '"'
+                row.request = (kind, arg)
+                return
+        except StopIteration as done:
+            # Trailing brackets need no forward pass; the value is already built
+            row.result = done.value
+            row.done = True
+
+    def _close_string(self, row):
+        value = self.tokenizer.decode(row.string_ids).strip()
+        row.string_ids = None
+        self._advance(row, value)
+
+    def _next_token(self, row, logits):
+        """Token to feed for row this step, or None once it is finished."""
+        while not row.done:
+            if row.queue:
+                return row.queue.pop(0)
+            if row.text:
+                row.queue = self.tokenizer.encode(row.text, add_special_tokens=False)
+                row.forced_tokens += len(row.queue)
+                row.text = ''
+                continue
+            if row.string_ids is not None:
+                if len(row.string_ids) < row.string_max and row.budget_left():
+                    token_id = sample_token(logits.masked_fill(~self.mask, float('-inf')), self.temperature)
+                    row.sampled_tokens += 1
+                    if token_id == self.quote_id:
+                        self._close_string(row)
+                    else:
+                        row.string_ids.append(token_id)
+                    return token_id
+                # Cap reached: close the string without sampling
+                row.text += '"'
+                self._close_string(row)
+                continue
+            kind, arg = row.request
+            row.request = None
+            if kind == 'choose':
+                first_ids = [self.tokenizer.encode(option, add_special_tokens=False)[0] for option in arg]
+                index = int(torch.argmax(logits[first_ids]))
+                row.text += arg[index]
+                self._advance(row, index)
+            else:
+                row.string_ids = []
+                row.string_max = arg
+        return None
+
+    def run(self, prompts, schema):
+        # Needs a left-padding tokenizer with a pad token (see precompute_recommendations.load_model)
+        device = self.model.device
+        rows = [_Row(schema, self.max_new_tokens) for _ in prompts]
+        for row in rows:
+            self._advance(row, None)
+
+        inputs = self.tokenizer(prompts, return_tensors='pt', padding=True).to(device)
+        attention_mask = inputs['attention_mask']
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+        with torch.inference_mode():
+            out = self.model(
+                input_ids=inputs['input_ids'], attention_mask=attention_mask,
+                position_ids=position_ids, use_cache=True
+            )
+            past, logits = out.past_key_values, out.logits[:, -1].float()
+            positions = position_ids[:, -1:]
+            self.mask = string_token_mask(self.tokenizer, logits.shape[-1], device).clone()
+            self.mask[self.quote_id] = True
+
+            while True:
+                tokens = [self._next_token(row, logits[i]) for i, row in enumerate(rows)]
+                active = [token is not None for token in tokens]
+                if not any(active):
+                    break
+                # Finished rows feed padding that the attention mask hides
+                tokens = [self.tokenizer.pad_token_id if token is None else token for token in tokens]
+                attention_mask = torch.cat(
+                    [attention_mask, torch.tensor(active, device=device, dtype=attention_mask.dtype)[:, None]], dim=1
+                )
+                positions = positions + 1
+                out = self.model(
+                    input_ids=torch.tensor(tokens, device=device)[:, None], attention_mask=attention_mask,
+                    position_ids=positions, past_key_values=past, use_cache=True
+                )
+                past, logits = out.past_key_values, out.logits[:, -1].float()
+
+        return [
+            (row.result, {'sampledTokens': row.sampled_tokens, 'forcedTokens': row.forced_tokens})
+            for row in rows
+        ]
+
+
+def generate_json(model, tokenizer, prompt, schema=RECOMMENDATIONS_SCHEMA, temperature=0.3, max_new_tokens=None):
+    """
+    Generate an object matching schema. Returns (obj, stats) where stats counts
+    sampled tokens and forced (skeleton) tokens.
+
+    max_new_tokens defaults to what the schema's caps allow, so no field is cut
+    short; pass a smaller value to bound latency instead.
+    """
+    if max_new_tokens is None:
+        max_new_tokens = max_sampled_tokens(schema)
+    decoder = SchemaDecoder(model, tokenizer, temperature=temperature, max_new_tokens=max_new_tokens)
+    decoder.start(prompt + JSON_INSTRUCTIONS)
+    result = decoder.value(schema)
+    return result, {'sampledTokens': decoder.sampled_tokens, 'forcedTokens': decoder.forced_tokens}
+
+
+def generate_json_batch(model, tokenizer, prompts, schema=RECOMMENDATIONS_SCHEMA, temperature=0.3, max_new_tokens=None):
+    """
+    generate_json for a batch of prompts in one KV cache. Returns a list of
+    (obj, stats), one per prompt. max_new_tokens applies to each row.
+    """
+    if max_new_tokens is None:
+        max_new_tokens = max_sampled_tokens(schema)
+    decoder = BatchSchemaDecoder(model, tokenizer, temperature=temperature, max_new_tokens=max_new_tokens)
+    return decoder.run([prompt + JSON_INSTRUCTIONS for prompt in prompts], schema)
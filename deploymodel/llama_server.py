@@ -1,10 +1,21 @@
-from fastapi import FastAPI
+import os
+
+from fastapi import FastAPI, Request
 from pydantic import BaseModel
 from transformers import AutoTokenizer, AutoModelForCausalLM
 from peft import PeftModel
-from meta_prompt_2 import meta_prompt_2  # Make sure this is a string template
+from meta_prompt_2 import fill_prompt
+from constrained_json import generate_json
 import torch
 
+# Same tracing module as the Lambdas, so traces continue across the hop. Its one
+# source is aws/lambdas/tracing.py; package_server.sh bundles it with this file
+import tracing
+
+# Chat answers are short; full recommendations get the larger budget
+RECOMMENDATIONS_MAX_NEW_TOKENS = int(os.environ.get("RECOMMENDATIONS_MAX_NEW_TOKENS", "5000"))
+CHAT_MAX_NEW_TOKENS = int(os.environ.get("CHAT_MAX_NEW_TOKENS", "512"))
+
 # === Load Model ===
 base_model_path = "llama3_3B"
 lora_path = "lora_llama_sft"
@@ -21,6 +32,19 @@ model.eval()
 # === Define API ===
 app = FastAPI()
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Continues the caller's trace (traceparent header) and times the request
+    trace = tracing.start_trace("llama-server", f"llama-server {request.method} {request.url.path}", dict(request.headers), method=request.method)
+    try:
+        response = await call_next(request)
+    except Exception as e:
+        tracing.finish_trace(trace, 500, e)
+        raise
+    response.headers["traceparent"] = trace.header()
+    tracing.finish_trace(trace, response.status_code)
+    return response
+
 # Input schema
 class UserInput(BaseModel):
     desired_job: str
@@ -29,6 +53,8 @@ class UserInput(BaseModel):
     job_experience: str
     clubs: str
     projects: str
+    question: str = ""  # optional, set when used as the chat fallback
+    structured: bool = False  # return schema-constrained JSON instead of prose
 
 @app.get("/")
 def normal():
@@ -37,29 +63,37 @@ def normal():
 @app.post("/generate")
 async def generate_recommendations(user: UserInput):
     # Fill in the prompt template
-    prompt = (
-        meta_prompt_2
-        .replace("{{desired_job}}", user.desired_job)
-        .replace("{{skills}}", user.skills)
-        .replace("{{job_experience}}", user.job_experience)
-        .replace("{{clubs}}", user.clubs)
-        .replace("{{projects}}", user.projects)
-    )
+    with tracing.span("prompt.build"):
+        prompt = fill_prompt(
+            user.desired_job, user.skills, user.job_experience, user.clubs, user.projects, user.student
+        )
+        if user.question:
+            prompt += f"\nAnswer this question from the student directly: {user.question}\n"
+
+    if user.structured and not user.question:
+        # Output is already parsed and matches the stored recommendations shape
+        with tracing.span("llama.generate_json") as span:
+            recommendations, usage = generate_json(model, tokenizer, prompt)
+            span.set(**usage)
+        return {"output": recommendations, "usage": usage}
 
     # Tokenize and run model
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+    with tracing.span("llama.generate") as span:
+        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
 
-    outputs = model.generate(
-        **inputs,
-        max_new_tokens=5000,
-        do_sample=True,
-        temperature=0.3,
-        top_p=0.9,
-        repetition_penalty=1.2,
-        eos_token_id=tokenizer.eos_token_id,
-        pad_token_id=tokenizer.eos_token_id,
-    )
+        outputs = model.generate(
+            **inputs,
+            max_new_tokens=CHAT_MAX_NEW_TOKENS if user.question else RECOMMENDATIONS_MAX_NEW_TOKENS,
+            do_sample=True,
+            temperature=0.3,
+            top_p=0.9,
+            repetition_penalty=1.2,
+            eos_token_id=tokenizer.eos_token_id,
+            pad_token_id=tokenizer.eos_token_id,
+        )
 
-    result = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    print(result)
+        # Only the newly generated tokens, not the echoed prompt
+        new_tokens = outputs[0][inputs["input_ids"].shape[1]:]
+        result = tokenizer.decode(new_tokens, skip_special_tokens=True)
+        span.set(promptTokens=inputs["input_ids"].shape[1], newTokens=len(new_tokens))
     return {"output": result}
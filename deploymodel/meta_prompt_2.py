@@ -18,4 +18,16 @@ Please provide suggestions categorized by:
 4. Certifications or Courses
 
 
-"""
\ No newline at end of file
+"""
+
+
+def fill_prompt(desired_job, skills, job_experience, clubs, projects, school=""):
+    return (
+        meta_prompt_2
+        .replace("{{desired_job}}", desired_job)
+        .replace("{{skills}}", skills)
+        .replace("{{job_experience}}", job_experience)
+        .replace("{{clubs}}", clubs)
+        .replace("{{projects}}", projects)
+        .replace("{{school}}", school or "my university")
+    )
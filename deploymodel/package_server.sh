@@ -0,0 +1,32 @@
+#!/bin/bash
+
+# Build a deployable bundle of the Llama server.
+#
+# llama_server.py imports tracing, whose single source is aws/lambdas/tracing.py
+# (shared with the Lambdas). This copies it next to the server modules so
+# the GPU host never needs the Lambda tree. The model and LoRA directories
+# (llama3_3B, lora_llama_sft) are not bundled; they stay on the host.
+#
+#   ./package_server.sh                 # -> llama_server.tar.gz
+#   tar -xzf llama_server.tar.gz && cd llama_server && uvicorn llama_server:app
+#
+# Locally, run from this directory with PYTHONPATH=../aws/lambdas instead.
+
+set -e
+
+SERVER_DIR="$(cd "$(dirname "$0")" && pwd)"
+OUTPUT="${1:-llama_server.tar.gz}"
+MODULES="llama_server.py meta_prompt_2.py constrained_json.py"
+
+BUILD_DIR="$(mktemp -d)"
+trap 'rm -rf "$BUILD_DIR"' EXIT
+
+mkdir "$BUILD_DIR/llama_server"
+for module in $MODULES; do
+    cp "$SERVER_DIR/$module" "$BUILD_DIR/llama_server/"
+done
+cp "$SERVER_DIR/../aws/lambdas/tracing.py" "$BUILD_DIR/llama_server/"
+
+tar -czf "$OUTPUT" -C "$BUILD_DIR" llama_server
+
+echo "✅ Packaged Llama server -> $OUTPUT"
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Precompute recommendations for every user whose profile changed.
+
+Spreads the recommendation load that otherwise hits /generate at semester
+start across an off-peak batch run:
+
+1. Parallel segmented Scan of ResuMAXUsers. Users are selected when their
+   formData is non-empty and either has no recommendations or formData
+   changed after them (formDataUpdatedAt later than recommendationsUpdatedAt,
+   both written by the resumax-user Lambda).
+2. The selected profiles are fed to the Llama model in large left-padded
+   batches through the schema-constrained decoder
+   (constrained_json.generate_json_batch), so each result is already in the
+   structured shape the app stores and renders, not free-form prose.
+3. Results are written back with conditional UpdateItem calls
+   (lastUpdated must still equal the scanned value). Users who saved in the
+   meantime are skipped and picked up by the next run, so their changes are
+   never overwritten. completedActivities is reset with the new plan, since
+   its "phaseIndex-taskIndex" keys would point at different tasks.
+
+Progress is checkpointed after the scan and after every batch, so a killed
+run resumes where it stopped.
+
+Local end-to-end run (DynamoDB Local or moto_server on :8000, tiny CPU model):
+
+    python precompute_recommendations.py --endpoint-url http://localhost:8000 \\
+        --seed-demo-users 50 --model hf-internal-testing/tiny-random-LlamaForCausalLM \\
+        --no-lora --device cpu --max-new-tokens 64
+"""
+
+import argparse
+import gzip
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+from meta_prompt_2 import fill_prompt
+
+TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME', 'ResuMAXUsers')
+PROFILE_DATA_TYPE = 'user_data'
+# Same threshold as the resumax-user Lambda, which decodes recommendationsGz
+RECOMMENDATIONS_GZIP_BYTES = int(os.environ.get('RECOMMENDATIONS_GZIP_BYTES', '2048'))
+
+
+def join_list(values, render=str):
+    if isinstance(values, list):
+        return ', '.join(render(value) for value in values if value)
+    return values or ''
+
+
+def prompt_for(form_data):
+    # Same field mapping as ApiService.getRecommendations in the frontend
+    return fill_prompt(
+        form_data.get('desiredOccupation', ''),
+        join_list(form_data.get('skills')),
+        join_list(form_data.get('experiences'), lambda exp: f"{exp.get('position', '')} at {exp.get('company', '')}" if isinstance(exp, dict) else str(exp)),
+        join_list(form_data.get('clubs')),
+        join_list(form_data.get('projects'), lambda proj: proj.get('name', '') if isinstance(proj, dict) else str(proj)),
+        form_data.get('school', '')
+    )
+
+
+def needs_recommendations(item):
+    form_data = item.get('formData') or {}
+    if not form_data:
+        return False
+    if not item.get('recommendations') and not item.get('recommendationsGz'):
+        return True
+    # Items saved before formData was timestamped have nothing saying it
+    # changed, so their recommendations are kept
+    form_data_updated_at = item.get('formDataUpdatedAt')
+    if not form_data_updated_at:
+        return False
+    return form_data_updated_at > item.get('recommendationsUpdatedAt', '')
+
+
+# ------------------------------
+# Checkpointing
+# ------------------------------
+
+def load_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return None
+
+
+def save_checkpoint(path, state):
+    if not path:
+        return
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+# ------------------------------
+# 1. Parallel segmented scan
+# ------------------------------
+
+def scan_segment(table, segment, total_segments, page_size):
+    selected = []
+    scanned = 0
+    kwargs = {
+        'Segment': segment,
+        'TotalSegments': total_segments,
+        'FilterExpression': Attr('dataType').eq(PROFILE_DATA_TYPE),
+        'ProjectionExpression': 'userID, formData, lastUpdated, formDataUpdatedAt, recommendationsUpdatedAt, '
+                                'recommendations, recommendationsGz',
+        'Limit': page_size
+    }
+    while True:
+        page = table.scan(**kwargs)
+        scanned += page.get('ScannedCount', 0)
+        for item in page.get('Items', []):
+            if needs_recommendations(item):
+                selected.append({
+                    'userID': item['userID'],
+                    'lastUpdated': item.get('lastUpdated', ''),
+                    'prompt': prompt_for(item['formData'])
+                })
+        if 'LastEvaluatedKey' not in page:
+            return selected, scanned
+        kwargs['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+
+def parallel_scan(table, total_segments, page_size):
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        results = list(executor.map(
+            lambda segment: scan_segment(table, segment, total_segments, page_size),
+            range(total_segments)
+        ))
+    candidates = [c for selected, _ in results for c in selected]
+    scanned = sum(count for _, count in results)
+    return candidates, scanned
+
+
+# ------------------------------
+# 2. Batched structured generation
+# ------------------------------
+
+def load_model(model_path, lora_path, device):
+    import torch
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    tokenizer.padding_side = 'left'  # the batched decoder appends after the padding
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    if device == 'cpu':
+        model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=torch.float32)
+    else:
+        model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=torch.float16, device_map='auto')
+    if lora_path:
+        from peft import PeftModel
+        model = PeftModel.from_pretrained(model, lora_path)
+    model.eval()
+    return tokenizer, model
+
+
+def generate_structured(tokenizer, model, prompts, max_new_tokens):
+    from constrained_json import generate_json_batch
+
+    return [result for result, _ in generate_json_batch(model, tokenizer, prompts, max_new_tokens=max_new_tokens)]
+
+
+# ------------------------------
+# 3. Write back
+# ------------------------------
+
+def write_result(table, candidate, output, generated_at):
+    """
+    Store one result, only if the user has not saved since the scan.
+
+    The check is part of the write (ConditionExpression on lastUpdated), so a
+    save landing at any point before it can never be overwritten.
+    """
+    # Large results are stored gzip-compressed, as the resumax-user Lambda does
+    raw = json.dumps(output, separators=(',', ':')).encode('utf-8')
+    if len(raw) > RECOMMENDATIONS_GZIP_BYTES:
+        attribute, value, other = 'recommendationsGz', gzip.compress(raw, mtime=0), 'recommendations'
+    else:
+        attribute, value, other = 'recommendations', output, 'recommendationsGz'
+    try:
+        table.update_item(
+            Key={'userID': candidate['userID'], 'dataType': PROFILE_DATA_TYPE},
+            UpdateExpression=f'SET {attribute} = :recommendations, recommendationsUpdatedAt = :generatedAt, '
+                             f'completedActivities = :empty REMOVE {other}',
+            ConditionExpression='lastUpdated = :seen',
+            ExpressionAttributeValues={
+                ':recommendations': value,
+                ':empty': {},
+                ':generatedAt': generated_at,
+                ':seen': candidate['lastUpdated']
+            }
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+
+
+def write_results(table, batch, outputs, workers=8):
+    """Conditionally write the batch; users who saved since the scan are skipped."""
+    generated_at = datetime.utcnow().isoformat()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(
+            lambda pair: write_result(table, pair[0], pair[1], generated_at),
+            zip(batch, outputs)
+        ))
+    written = sum(results)
+    return written, len(results) - written
+
+
+def seed_demo_users(dynamodb, count):
+    """Create the table (if needed) and fake users on a local DynamoDB."""
+    existing = [t.name for t in dynamodb.tables.all()]
+    if TABLE_NAME not in existing:
+        dynamodb.create_table(
+            TableName=TABLE_NAME,
+            KeySchema=[{'AttributeName': 'userID', 'KeyType': 'HASH'}, {'AttributeName': 'dataType', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': 'userID', 'AttributeType': 'S'}, {'AttributeName': 'dataType', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        ).wait_until_exists()
+    jobs = ['Software Engineer', 'Data Scientist', 'Product Manager', 'ML Engineer']
+    with dynamodb.Table(TABLE_NAME).batch_writer() as writer:
+        for i in range(count):
+            writer.put_item(Item={
+                'userID': f'demo-{i}',
+                'dataType': PROFILE_DATA_TYPE,
+                'formData': {
+                    'school': 'University of Washington',
+                    'desiredOccupation': jobs[i % len(jobs)],
+                    'skills': ['Python', 'SQL'],
+                    'clubs': ['ACM'],
+                    'projects': [{'name': f'Project {i}'}]
+                },
+                'completedActivities': {},
+                'lastUpdated': datetime.utcnow().isoformat()
+            })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--endpoint-url', help='DynamoDB endpoint, e.g. http://localhost:8000 for a local stand-in')
+    parser.add_argument('--segments', type=int, default=8, help='parallel Scan segments')
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=32, help='profiles per decoder batch')
+    parser.add_argument('--max-new-tokens', type=int, help='sampled-token budget (default: what the schema caps allow)')
+    parser.add_argument('--model', default='llama3_3B')
+    parser.add_argument('--lora', default='lora_llama_sft')
+    parser.add_argument('--no-lora', action='store_true')
+    parser.add_argument('--device', choices=['auto', 'cpu'], default='auto')
+    parser.add_argument('--checkpoint', default='precompute_checkpoint.json')
+    parser.add_argument('--seed-demo-users', type=int, default=0, help='only with --endpoint-url')
+    parser.add_argument('--dry-run', action='store_true', help='scan and report without generating')
+    args = parser.parse_args()
+
+    dynamodb = boto3.resource('dynamodb', endpoint_url=args.endpoint_url)
+    table = dynamodb.Table(TABLE_NAME)
+
+    if args.seed_demo_users:
+        if not args.endpoint_url:
+            parser.error('--seed-demo-users is only allowed against a local --endpoint-url')
+        seed_demo_users(dynamodb, args.seed_demo_users)
+
+    state = load_checkpoint(args.checkpoint)
+    if state is None:
+        started = time.time()
+        candidates, scanned = parallel_scan(table, args.segments, args.page_size)
+        print(f"Scanned {scanned} items in {time.time() - started:.1f}s with {args.segments} segments; {len(candidates)} need recommendations")
+        state = {'candidates': candidates, 'next': 0, 'written': 0, 'skipped': 0}
+        save_checkpoint(args.checkpoint, state)
+    else:
+        print(f"Resuming from checkpoint at {state['next']}/{len(state['candidates'])}")
+
+    if args.dry_run:
+        return
+
+    tokenizer, model = load_model(args.model, None if args.no_lora else args.lora, args.device)
+    candidates = state['candidates']
+    while state['next'] < len(candidates):
+        batch = candidates[state['next']:state['next'] + args.batch_size]
+        started = time.time()
+        outputs = generate_structured(tokenizer, model, [c['prompt'] for c in batch], args.max_new_tokens)
+        written, skipped = write_results(table, batch, outputs)
+        state['next'] += len(batch)
+        state['written'] += written
+        state['skipped'] += skipped
+        save_checkpoint(args.checkpoint, state)
+        print(f"Batch of {len(batch)} in {time.time() - started:.1f}s: {written} written, {skipped} skipped ({state['next']}/{len(candidates)})")
+
+    print(f"Done: {state['written']} written, {state['skipped']} skipped")
+    if args.checkpoint and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,30 +2,38 @@ import json
 import os
 import urllib3
 import time
-import boto3
 from decimal import Decimal
+# Shared helpers from aws/lambdas; deploy with aws/lambdas/package_lambda.sh
+import context_builder
+import gemini_stream
+import lambda_runtime
+import resilience
+import semantic_cache
+import tracing
 
-# Initialize HTTP client outside handler for reuse
-http = urllib3.PoolManager()
+# Clients are created once per container and reused by warm invocations
+http = lambda_runtime.http
 
 # Initialize DynamoDB
 try:
-    dynamodb = boto3.resource('dynamodb')
-    DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME', 'ResuMAXUsers') 
-    DYNAMODB_TABLE = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    DYNAMODB_TABLE_NAME = lambda_runtime.TABLE_NAME
+    DYNAMODB_TABLE = lambda_runtime.get_table()
 except Exception as e:
     print(f"Error initializing DynamoDB: {e}")
 
 # Configuration
 GEMINI_MODEL_NAME = 'gemini-pro'
-MAX_RETRIES = 3
-INITIAL_DELAY = 1
+GEMINI_API_BASE = os.environ.get('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com')
+# Answers built from a user's resume are personal; only general advice is shared
+GENERAL_SIGNATURE = 'general'
+HISTORY_TOKEN_BUDGET = int(os.environ.get('HISTORY_TOKEN_BUDGET', '600'))
 
 # CORS headers
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': '*',
-    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-    'Access-Control-Allow-Methods': 'GET,POST,PUT,DELETE,OPTIONS'
+    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,traceparent',
+    'Access-Control-Allow-Methods': 'GET,POST,PUT,DELETE,OPTIONS',
+    'Access-Control-Expose-Headers': 'traceparent'
 }
 
 def create_response(status_code, body, headers=None):
@@ -36,10 +44,14 @@ def create_response(status_code, body, headers=None):
     if headers:
         response_headers.update(headers)
     
+    with tracing.span('serialize') as span:
+        response_body = json.dumps(body)
+        span.set(bytes=len(response_body))
+    
     return {
         'statusCode': status_code,
         'headers': response_headers,
-        'body': json.dumps(body)
+        'body': response_body
     }
 
 def get_resume_data(user_id):
@@ -68,6 +80,7 @@ def get_resume_data(user_id):
 
 
 def get_chat_history(user_id):
+    """Return (chat_history, summary_item); the rolling summary lives on the same item."""
     try:
         response = DYNAMODB_TABLE.get_item(
             Key={
@@ -79,25 +92,39 @@ def get_chat_history(user_id):
         item = response.get('Item')
         
         if not item:
-            return []
+            return [], {}
         
         chat_history = item.get('chatHistory', [])
-        return chat_history
+        return chat_history, context_builder.summary_fields(item)
     
     except Exception as e:
         print(f"DynamoDB Read Error: {e}")
-        return []
+        return [], {}
+
+
+def new_turns(user_message, reply):
+    # Increasing ids let the rolling summary skip turns it already holds
+    now_ms = int(time.time() * 1000)
+    return [
+        {'id': now_ms - 1, 'role': 'user', 'content': user_message},
+        {'id': now_ms, 'role': 'model', 'content': reply}
+    ]
 
 
-def update_chat_history(user_id, new_history):
+def update_chat_history(user_id, new_history, summary_item=None):
     trimmed_history = new_history[-10:]
     
+    # Turns falling out of the stored window are folded into the rolling summary
+    evicted = [(msg.get('role'), msg.get('content', ''), msg.get('id')) for msg in new_history[:-10]]
+    summary_item = context_builder.fold_into_summary(summary_item, evicted) or summary_item or {}
+    
     try:
         DYNAMODB_TABLE.put_item(
             Item={
                 'userID': user_id,
                 'dataType': 'CHAT_HISTORY',
                 'chatHistory': trimmed_history,
+                **context_builder.summary_fields(summary_item),
                 'updatedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
             }
         )
@@ -161,9 +188,7 @@ def format_recommendations(recommendations):
     return '\n'.join(formatted)
 
 
-def call_gemini_api(message, history, system_instruction, api_key):
-    url = f'https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL_NAME}:generateContent?key={api_key}'    
-    
+def build_gemini_payload(message, history, system_instruction):
     contents = []
     for msg in history:
         role = 'user' if msg.get('role') == 'user' else 'model'
@@ -177,7 +202,7 @@ def call_gemini_api(message, history, system_instruction, api_key):
         'parts': [{'text': message}]
     })
     
-    payload = {
+    return {
         'contents': contents,
         'systemInstruction': {
             'parts': [{'text': system_instruction}]
@@ -189,31 +214,38 @@ def call_gemini_api(message, history, system_instruction, api_key):
             'maxOutputTokens': 2048,
         }
     }
+
+
+def call_gemini_api(message, history, system_instruction, api_key, timeout=None):
+    url = f'{GEMINI_API_BASE}/v1beta/models/{GEMINI_MODEL_NAME}:generateContent?key={api_key}'
+    payload = build_gemini_payload(message, history, system_instruction)
     
     encoded_data = json.dumps(payload).encode('utf-8')
     
-    response = http.request(
-        'POST',
-        url,
-        body=encoded_data,
-        headers={'Content-Type': 'application/json'}
-    )
-    
-    if response.status != 200:
-        error_details = response.data.decode()
-        raise Exception(f'Gemini API error: {response.status} - {error_details}')
+    with tracing.span('gemini.generate', model=GEMINI_MODEL_NAME, requestBytes=len(encoded_data)) as span:
+        response = http.request(
+            'POST',
+            url,
+            body=encoded_data,
+            headers={'Content-Type': 'application/json'},
+            timeout=urllib3.Timeout(connect=min(2.0, timeout), read=timeout) if timeout else None,
+            retries=False
+        )
+        span.set(httpStatus=response.status, responseBytes=len(response.data))
+        
+        resilience.check_response(response, 'Gemini API')
     
     result = json.loads(response.data.decode('utf-8'))
     
     prompt_feedback = result.get('promptFeedback', {})
     if prompt_feedback.get('blockReason'):
-        return "I'm sorry, I cannot process that request due to safety policies."
+        return gemini_stream.SAFETY_BLOCKED_PROMPT
 
     if 'candidates' in result and len(result['candidates']) > 0:
         candidate = result['candidates'][0]
         
         if candidate.get('finishReason') == 'SAFETY':
-            return "The response was blocked by safety filters."
+            return gemini_stream.SAFETY_BLOCKED_RESPONSE
 
         if 'content' in candidate and 'parts' in candidate['content']:
             text_parts = [part['text'] for part in candidate['content']['parts'] if 'text' in part]
@@ -223,20 +255,197 @@ def call_gemini_api(message, history, system_instruction, api_key):
     raise Exception('Unexpected response format from Gemini API')
 
 
-def call_gemini_api_with_retry(message, history, system_instruction, api_key):
-    delay = INITIAL_DELAY
-    for i in range(MAX_RETRIES):
-        try:
-            return call_gemini_api(message, history, system_instruction, api_key)
-        except Exception as e:
-            if i < MAX_RETRIES - 1:
-                print(f"Retry {i+1}/{MAX_RETRIES} after error: {e}")
-                time.sleep(delay)
-                delay *= 2
-            else:
-                raise
+def call_gemini_api_with_retry(message, history, system_instruction, api_key, context=None, fallback_payload=None):
+    """Returns (reply, backend); backend is 'gemini' or 'llama'."""
+    deadline = resilience.deadline_from_context(context)
+    return resilience.call_with_fallback(
+        lambda timeout: call_gemini_api(message, history, system_instruction, api_key, timeout),
+        deadline,
+        fallback_payload=fallback_payload
+    )
+
+
+def build_llama_payload(message, resume_text):
+    # Maps the chat request onto llama_server.py's /generate input schema
+    return {
+        'desired_job': '',
+        'skills': '',
+        'job_experience': context_builder.truncate_to_tokens(resume_text or '', 300),
+        'clubs': '',
+        'projects': '',
+        'question': message
+    }
 
 
+def prepare_chat(body):
+    """
+    Load the user's context and build the prompt for one chat turn.
+
+    Returns (chat, None) on success or (None, (status, error_body)).
+    """
+    user_message = body.get('message', '')
+    user_id = body.get('userId')
+    
+    if not user_message:
+        return None, (400, {'error': 'Message is required'})
+    
+    if not user_id:
+        return None, (400, {'error': 'userId is required'})
+    
+    api_key = os.environ.get('GEMINI_API_KEY')
+    if not api_key:
+        return None, (500, {'error': 'API key not configured'})
+    
+    # Get resume data and chat history
+    resume_text, recommendations = get_resume_data(user_id)
+    existing_history, summary_item = get_chat_history(user_id)
+    
+    # Only the most recent turns that fit the history budget are resent
+    with tracing.span('prompt.history') as span:
+        recent_history, history_tokens = context_builder.fit_recent_turns(
+            existing_history, HISTORY_TOKEN_BUDGET, lambda msg: msg.get('content', '')
+        )
+        # Gemini requires the conversation to open with a user turn
+        while recent_history and recent_history[0].get('role') != 'user':
+            history_tokens -= context_builder.count_tokens(recent_history.pop(0).get('content', ''))
+        
+        # Everything older than the resent turns goes into the rolling summary,
+        # saved with the history at the end of the turn. Only turns with ids can
+        # be deduplicated; older id-less turns are folded when they leave the
+        # stored window instead
+        older_history = existing_history[:len(existing_history) - len(recent_history)]
+        summary_item = context_builder.fold_into_summary(
+            summary_item, [(msg.get('role'), msg.get('content', ''), msg['id']) for msg in older_history if msg.get('id') is not None]
+        ) or summary_item
+        span.set(resentTurns=len(recent_history), olderTurns=len(older_history))
+    summary = summary_item.get('summary', '')
+    
+    # Build system instruction based on available data, within the token budget
+    has_resume = bool(resume_text and resume_text != 'No resume uploaded.')
+    if has_resume:
+        # User has resume data - use it for context
+        formatted_recs = format_recommendations(recommendations)
+        
+        sections = [
+            context_builder.section('intro', "You are an expert resume advisor and career coach.\n", 0, required=True),
+            context_builder.section('resume', f"\nUSER'S RESUME:\n{resume_text}\n", 2),
+            context_builder.section('recommendations', f"\nPERSONALIZED RECOMMENDATIONS:\n{formatted_recs}\n", 1),
+            context_builder.section('summary', f"\nEARLIER CONVERSATION (summary):\n{summary}\n" if summary else '', 3),
+            context_builder.section('closing', "\nHelp the user with their career questions. Be concise and actionable.", 0, required=True),
+        ]
+    else:
+        # No resume data - provide general career advice
+        sections = [
+            context_builder.section('intro', """You are a helpful career advisor and resume expert. The user hasn't uploaded a resume yet, so provide general career guidance and advice. 
+
+You can help with:
+- General career planning
+- Resume writing tips
+- Interview preparation
+- Skill development
+- Industry insights
+- Networking strategies
+
+Be encouraging, practical, and suggest they upload their resume for more personalized advice.""", 0, required=True),
+            context_builder.section('summary', f"\n\nEARLIER CONVERSATION (summary):\n{summary}" if summary else '', 3),
+        ]
+    
+    with tracing.span('prompt.build') as span:
+        system_instruction, system_tokens = context_builder.assemble(sections)
+        prompt_tokens = system_tokens + history_tokens + context_builder.count_tokens(user_message)
+        span.set(promptTokens=prompt_tokens, hasResume=has_resume)
+    
+    return {
+        'user_id': user_id,
+        'user_message': user_message,
+        'api_key': api_key,
+        'system_instruction': system_instruction,
+        'recent_history': recent_history,
+        'existing_history': existing_history,
+        'summary_item': summary_item,
+        'prompt_tokens': prompt_tokens,
+        'fallback_payload': build_llama_payload(user_message, resume_text) if resilience.LLAMA_FALLBACK_URL else None,
+        # Shared answers must not depend on anything of this user's: no resume,
+        # summary or earlier turns in the prompt
+        'cacheable': not has_resume and not summary and not recent_history
+    }, None
+
+
+def lookup_cached_answer(chat):
+    if not chat['cacheable']:
+        return 'bypass', None
+    with tracing.span('cache.lookup') as span:
+        status, answer = semantic_cache.answers.lookup(chat['user_message'], GENERAL_SIGNATURE)
+        span.set(result=status)
+    return status, answer
+
+
+def store_cached_answer(chat, answer, backend, latency_ms):
+    if chat['cacheable'] and backend == 'gemini' and answer not in gemini_stream.PLACEHOLDER_REPLIES:
+        semantic_cache.answers.store(chat['user_message'], GENERAL_SIGNATURE, answer, latency_ms)
+
+
+def stream_chat(body, context=None):
+    """
+    Yield the reply as server-sent events while Gemini generates it.
+
+    Uses :streamGenerateContent so the first words reach the client before
+    generation finishes. Chat history is persisted once the stream
+    completes; the final event reports ttfbMs for tracking.
+    """
+    started = time.monotonic()
+    chat, error = prepare_chat(body)
+    if error:
+        yield gemini_stream.sse({'status': error[0], **error[1]})
+        return
+    
+    url = f"{GEMINI_API_BASE}/v1beta/models/{GEMINI_MODEL_NAME}:streamGenerateContent?alt=sse&key={chat['api_key']}"
+    payload = build_gemini_payload(chat['user_message'], chat['recent_history'], chat['system_instruction'])
+    
+    parts = []
+    ttfb_ms = None
+    cache_status, cached_answer = lookup_cached_answer(chat)
+    try:
+        if cache_status == 'hit':
+            result, backend = cached_answer, 'cache'
+        else:
+            result, backend = resilience.call_with_fallback(
+                lambda timeout: gemini_stream.open_stream(http, url, payload, timeout),
+                resilience.deadline_from_context(context),
+                fallback_payload=chat['fallback_payload'],
+                # A Gemini stream that opens after Llama already won is never read
+                discard=gemini_stream.discard
+            )
+        # Cached and Llama replies are not streamed; they arrive as one chunk
+        chunks = gemini_stream.iter_text(result) if backend == 'gemini' else [result]
+        for text in chunks:
+            if ttfb_ms is None:
+                ttfb_ms = int((time.monotonic() - started) * 1000)
+                tracing.annotate(ttfbMs=ttfb_ms, backend=backend)
+            parts.append(text)
+            yield gemini_stream.sse({'text': text})
+    except Exception as e:
+        print(f"Gemini stream error: {e}")
+        yield gemini_stream.sse({'error': 'Failed to get AI response', 'details': str(e)})
+        return
+    
+    reply = ''.join(parts)
+    store_cached_answer(chat, reply, backend, (time.monotonic() - started) * 1000)
+    new_history = chat['existing_history'] + [
+        *new_turns(chat['user_message'], reply)
+    ]
+    update_chat_history(chat['user_id'], new_history, chat['summary_item'])
+    
+    yield gemini_stream.sse({
+        'done': True,
+        'promptTokens': 0 if cache_status == 'hit' else chat['prompt_tokens'],
+        'backend': backend,
+        'cache': cache_status,
+        'ttfbMs': ttfb_ms
+    })
+
+
+@tracing.traced_handler('chat-fallback')
 def lambda_handler(event, context):
     # Get HTTP method
     http_method = event.get('httpMethod')
@@ -246,83 +455,52 @@ def lambda_handler(event, context):
     if not http_method:
         http_method = 'POST'
     
-    print(f"HTTP Method: {http_method}")
-
     # Handle OPTIONS
     if http_method == 'OPTIONS':
         return create_response(200, {'message': 'CORS preflight'})
     
     try:
         body = json.loads(event.get('body', '{}'))
-        user_message = body.get('message', '')
-        user_id = body.get('userId')
-        
-        if not user_message:
-            return create_response(400, {'error': 'Message is required'})
-        
-        if not user_id:
-            return create_response(400, {'error': 'userId is required'})
-        
-        api_key = os.environ.get('GEMINI_API_KEY')
-        if not api_key:
-            return create_response(500, {'error': 'API key not configured'})
-        
-        # Get resume data and chat history
-        resume_text, recommendations = get_resume_data(user_id)
-        existing_history = get_chat_history(user_id)
-        
-        # Build system instruction based on available data
-        if resume_text and resume_text != 'No resume uploaded.':
-            # User has resume data - use it for context
-            formatted_recs = format_recommendations(recommendations)
-            
-            system_instruction = f"""You are an expert resume advisor and career coach.
-
-USER'S RESUME:
-{resume_text[:3000]}
-
-PERSONALIZED RECOMMENDATIONS:
-{formatted_recs}
-
-Help the user with their career questions. Be concise and actionable."""
-        else:
-            # No resume data - provide general career advice
-            system_instruction = """You are a helpful career advisor and resume expert. The user hasn't uploaded a resume yet, so provide general career guidance and advice. 
-
-You can help with:
-- General career planning
-- Resume writing tips
-- Interview preparation
-- Skill development
-- Industry insights
-- Networking strategies
-
-Be encouraging, practical, and suggest they upload their resume for more personalized advice."""
+        chat, error = prepare_chat(body)
+        if error:
+            return create_response(*error)
         
+        cache_status, gemini_response = lookup_cached_answer(chat)
+        backend = 'cache'
         try:
-            gemini_response = call_gemini_api_with_retry(
-                user_message, 
-                existing_history, 
-                system_instruction, 
-                api_key
-            )
+            if cache_status != 'hit':
+                started = time.monotonic()
+                gemini_response, backend = call_gemini_api_with_retry(
+                    chat['user_message'], 
+                    chat['recent_history'], 
+                    chat['system_instruction'], 
+                    chat['api_key'],
+                    context=context,
+                    fallback_payload=chat['fallback_payload']
+                )
+                store_cached_answer(chat, gemini_response, backend, (time.monotonic() - started) * 1000)
         except Exception as e:
             print(f"Gemini error: {e}")
-            return create_response(500, {
+            # Fail fast with 503 while Gemini is known to be unavailable
+            unavailable = isinstance(e, (resilience.CircuitOpenError, resilience.DeadlineExceeded))
+            return create_response(503 if unavailable else 500, {
                 'error': 'Failed to get AI response',
                 'details': str(e)
             })
         
         # Update chat history
-        new_history = existing_history + [
-            {'role': 'user', 'content': user_message},
-            {'role': 'model', 'content': gemini_response}
+        new_history = chat['existing_history'] + [
+            *new_turns(chat['user_message'], gemini_response)
         ]
         
-        update_chat_history(user_id, new_history)
+        update_chat_history(chat['user_id'], new_history, chat['summary_item'])
+        print(json.dumps({'semanticCache': cache_status, **semantic_cache.answers.stats()}))
         
         return create_response(200, {
             'response': gemini_response,
+            'promptTokens': 0 if cache_status == 'hit' else chat['prompt_tokens'],
+            'backend': backend,
+            'cache': cache_status,
             'request_id': context.aws_request_id
         })
         
@@ -330,8 +508,7 @@ Be encouraging, practical, and suggest they upload their resume for more persona
         return create_response(400, {'error': 'Invalid JSON'})
     except Exception as e:
         print(f"Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        lambda_runtime.log_exception()
         return create_response(500, {
             'error': 'Internal server error',
             'details': str(e)
@@ -0,0 +1,87 @@
+"""
+Chunked-HTTP runner for the streaming chat path.
+
+Python Lambdas cannot stream responses from a plain handler, so this server
+is what gets deployed for streaming: behind the AWS Lambda Web Adapter with
+AWS_LWA_INVOKE_MODE=RESPONSE_STREAM (Function URL invoke mode
+RESPONSE_STREAM), or run directly for local testing. The shared helpers
+(tracing, context_builder, resilience, ...) live in aws/lambdas and are
+bundled next to this file when deployed (see aws/lambdas/package_lambda.sh);
+locally put them on the path:
+
+    PYTHONPATH=../aws/lambdas GEMINI_API_KEY=... python chat_stream_server.py
+    curl -N -X POST localhost:8080/chat/stream -d '{"userId": "u1", "message": "hi"}'
+
+Set GEMINI_API_BASE to point at a fake streaming server.
+"""
+
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import tracing
+from UPDATED_LAMBDA_WITH_FALLBACK import CORS_HEADERS, stream_chat
+
+PORT = int(os.environ.get('PORT', '8080'))
+
+
+class ChatStreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def send_cors_headers(self):
+        for name, value in CORS_HEADERS.items():
+            self.send_header(name, value)
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_cors_headers()
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        if self.path != '/chat/stream':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            body = None
+        if not isinstance(body, dict):
+            payload = json.dumps({'error': 'Invalid JSON'}).encode('utf-8')
+            self.send_response(400)
+            self.send_cors_headers()
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        trace = tracing.start_trace('chat-stream', 'chat-stream POST', dict(self.headers.items()), method='POST')
+        self.send_response(200)
+        self.send_cors_headers()
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('traceparent', tracing.traceparent())
+        self.end_headers()
+
+        # One HTTP chunk per event, flushed immediately
+        try:
+            for event in stream_chat(body):
+                self.wfile.write(f"{len(event):X}\r\n".encode('ascii') + event + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except Exception as e:
+            tracing.finish_trace(trace, 200, e)
+            raise
+        tracing.finish_trace(trace, 200)
+
+
+if __name__ == '__main__':
+    print(f"Streaming chat on :{PORT}")
+    ThreadingHTTPServer(('0.0.0.0', PORT), ChatStreamHandler).serve_forever()
@@ -236,7 +236,7 @@ function ActionPlan({ userProfile, recommendations, onActivityComplete }) {
                   <div>
                     <h5 className="text-sm font-medium text-gray-700 mb-2">Resources & Links</h5>
                     <div className="flex flex-wrap gap-2">
-                      {task.resources.map((resource, resourceIndex) => (
+                      {(task.resources || []).map((resource, resourceIndex) => (
                         resource.startsWith('http') ? (
                           <a
                             key={resourceIndex}
@@ -67,7 +67,14 @@ function ResumeAnalysis() {
           }
           
           if (userData && userData.recommendations && Object.keys(userData.recommendations).length > 0) {
-            setRecommendations(userData.recommendations)
+            // Activity ticks are patched into the top-level completedActivities map
+            setRecommendations({
+              ...userData.recommendations,
+              completedActivities: {
+                ...(userData.recommendations.completedActivities || {}),
+                ...(userData.completedActivities || {})
+              }
+            })
             setAnalysisComplete(true)
             setActiveTab('recommendations') // Skip directly to results
             console.log('✅ Previous recommendations loaded - skipping to results!')
@@ -112,24 +119,18 @@ function ResumeAnalysis() {
       
       // Save activity completion to database
       if (isAuthenticated) {
-        const updatedRecommendations = {
-          ...recommendations,
-          completedActivities: {
-            ...(recommendations?.completedActivities || {}),
-            [`${activityData.phaseIndex}-${activityData.taskIndex}`]: {
-              task: activityData.task,
-              completed: activityData.completed,
-              completedAt: activityData.completed ? new Date().toISOString() : null
-            }
-          }
-        }
+        const activityKey = `${activityData.phaseIndex}-${activityData.taskIndex}`
         
-        await ApiService.saveUserData({
-          formData: formData,
-          recommendations: updatedRecommendations,
-          completedActivities: updatedRecommendations.completedActivities,
-          lastUpdated: new Date().toISOString()
-        })
+        // Only the ticked activity is sent, not the whole profile
+        await ApiService.patchUserData([{
+          op: 'replace',
+          path: `/completedActivities/${activityKey}`,
+          value: {
+            task: activityData.task,
+            completed: activityData.completed,
+            completedAt: activityData.completed ? new Date().toISOString() : null
+          }
+        }])
         
         console.log('✅ Activity completion saved to database!')
       }
@@ -5,6 +5,12 @@ const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:3000
 import authService from './authService'
 import { LAMBDA_ENDPOINTS } from '../config/api'
 
+// W3C traceparent for one request; the backend decides whether to sample it
+function newTraceparent() {
+  const hex = (bytes) => Array.from(crypto.getRandomValues(new Uint8Array(bytes)), b => b.toString(16).padStart(2, '0')).join('')
+  return `00-${hex(16)}-${hex(8)}-00`
+}
+
 class ApiService {
   // Get authentication headers
   async getAuthHeaders() {
@@ -28,7 +34,8 @@ class ApiService {
           console.log('✅ Got auth token')
           return {
             'Authorization': `Bearer ${token}`,
-            'Content-Type': 'application/json'
+            'Content-Type': 'application/json',
+            'traceparent': newTraceparent()
           }
         } else {
           console.log('⚠️ No token found in session')
@@ -40,7 +47,8 @@ class ApiService {
     
     console.log('📝 Using headers without auth token')
     return {
-      'Content-Type': 'application/json'
+      'Content-Type': 'application/json',
+      'traceparent': newTraceparent()
     }
   }
 
@@ -86,7 +94,9 @@ class ApiService {
         clubs: Array.isArray(userProfile.clubs) ? userProfile.clubs.join(', ') : (userProfile.clubs || ''),
         projects: Array.isArray(userProfile.projects)
           ? userProfile.projects.map(proj => proj.name).join(', ')
-          : ''
+          : '',
+        // Ask for schema-constrained JSON (actionPlan/classes/skills/...)
+        structured: true
       }
       
       console.log('📊 Request data:', requestData)
@@ -107,7 +117,10 @@ class ApiService {
       const data = await response.json()
       console.log('✅ Llama response received:', data)
       
-      // For now, just return the raw response
+      // Structured responses are already parsed; older servers return prose
+      if (data && data.output && typeof data.output === 'object') {
+        return data.output
+      }
       return data
       
     } catch (error) {
@@ -150,14 +163,16 @@ class ApiService {
       const response = await fetch('https://3tau6691m5.execute-api.us-east-1.amazonaws.com/gemc', {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json'
+          'Content-Type': 'application/json',
+          'traceparent': newTraceparent()
         },
         body: JSON.stringify(requestData)
       })
       
       if (!response.ok) {
         const errorText = await response.text()
-        console.error('❌ Chatbot API error:', response.status, errorText)
+        // The trace id finds this request in the Lambda logs
+        console.error('❌ Chatbot API error:', response.status, errorText, response.headers.get('traceparent'))
         throw new Error(`Chatbot failed: ${response.status} - ${errorText}`)
       }
       
@@ -323,6 +338,42 @@ class ApiService {
     }
   }
 
+  // Apply a field-level change (JSON-patch style operations) via Lambda
+  // e.g. [{ op: 'replace', path: '/completedActivities/0-1', value: {...} }]
+  async patchUserData(patch) {
+    try {
+      const headers = await this.getAuthHeaders()
+      let userId = 'authenticated_user'
+
+      try {
+        if (headers.Authorization) {
+          const token = headers.Authorization.replace('Bearer ', '')
+          const payload = JSON.parse(atob(token.split('.')[1]))
+          userId = payload.sub || payload['cognito:username'] || payload.email || 'authenticated_user'
+        }
+      } catch (tokenError) {
+        console.log('⚠️ Could not extract user ID from token:', tokenError.message)
+      }
+
+      const response = await fetch(LAMBDA_ENDPOINTS.SAVE_USER, {
+        method: 'PATCH',
+        headers,
+        body: JSON.stringify({ userId, patch })
+      })
+
+      if (!response.ok) {
+        const errorText = await response.text()
+        console.error('❌ Patch failed:', response.status, errorText)
+        throw new Error(`Patch user data failed: ${response.status} - ${errorText}`)
+      }
+
+      return await response.json()
+    } catch (error) {
+      console.error('💥 Patch error:', error)
+      throw error
+    }
+  }
+
   // Update user resume data in DynamoDB via Lambda
   async updateUserData(userData) {
     try {